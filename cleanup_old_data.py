@@ -18,8 +18,8 @@ def cleanup_all_old_data():
     
     for collection_name in collections_to_clean:
         try:
-            # Get all documents in collection
-            docs = db.collection(collection_name).get()
+            # Stream documents instead of loading the whole collection into memory
+            docs = db.collection(collection_name).stream()
             
             deleted_count = 0
             for doc in docs:
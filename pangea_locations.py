@@ -29,6 +29,8 @@ RESTAURANTS = {
 
 # convenience list for FAQ answers or drop-downs
 AVAILABLE_RESTAURANTS = list(RESTAURANTS.keys())
+# pre-formatted "- name" lines for prompts (built once so prompt bytes never change)
+RESTAURANTS_BULLET_LIST = "\n".join(f"- {r}" for r in AVAILABLE_RESTAURANTS)
 
 # === DROP-OFF LOCATIONS ===============================================
 DROPOFFS = {
@@ -60,4 +62,33 @@ DROPOFFS = {
     },
 }
 
-AVAILABLE_DROPOFF_LOCATIONS = list(DROPOFFS.keys())
\ No newline at end of file
+AVAILABLE_DROPOFF_LOCATIONS = list(DROPOFFS.keys())
+DROPOFFS_BULLET_LIST = "\n".join(f"- {d}" for d in AVAILABLE_DROPOFF_LOCATIONS)
+
+# === ALIASES ==========================================================
+# lowercase phrases users actually text -> canonical names above
+# (same rules SPONTANEOUS_REQUEST_SYSTEM_PROMPT gives Claude)
+RESTAURANT_NAME_ALIASES = {
+    "mcdonald's": "McDonald's",
+    "mcdonalds": "McDonald's",
+    "chipotle": "Chipotle",
+    "chick-fil-a": "Chick-fil-A",
+    "chickfila": "Chick-fil-A",
+    "chick fil a": "Chick-fil-A",
+    "portillo's": "Portillo's",
+    "portillos": "Portillo's",
+    "starbucks": "Starbucks",
+    "coffee": "Starbucks",
+}
+
+DROPOFF_NAME_ALIASES = {
+    "library": "Richard J Daley Library",
+    "daley": "Richard J Daley Library",
+    "student center east": "Student Center East",
+    "sce": "Student Center East",
+    "student center west": "Student Center West",
+    "scw": "Student Center West",
+    "student services": "Student Services Building",
+    "ssb": "Student Services Building",
+    "university hall": "University Hall",
+}
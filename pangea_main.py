@@ -5,61 +5,187 @@ CLEANED VERSION - Duplicates removed
 """
 
 import os
+import re
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, TypedDict, Annotated
+import copy
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, TypedDict, Annotated
 from dataclasses import dataclass
-from venv import logger
+import logging
 from dotenv import load_dotenv # This loads the .env file
 import uuid
 import random
+import threading
+import time
+import hashlib
+import hmac
+import traceback
+import heapq
+from itertools import chain
+from functools import lru_cache
+
+try:
+    import orjson  # Optional C-accelerated JSON; falls back to the stdlib module
+except ImportError:
+    orjson = None
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 # Import order processing system
 from pangea_order_processor import start_order_process, process_order_message
 
 # Import locations
-from pangea_locations import AVAILABLE_RESTAURANTS, AVAILABLE_DROPOFF_LOCATIONS
-
 from pangea_locations import (
     RESTAURANTS,
     DROPOFFS,
     AVAILABLE_RESTAURANTS,
-    AVAILABLE_DROPOFF_LOCATIONS,
+    RESTAURANTS_BULLET_LIST,
+    DROPOFFS_BULLET_LIST,
+    RESTAURANT_NAME_ALIASES,
+    DROPOFF_NAME_ALIASES,
 )
 
 MAX_GROUP_SIZE = 3 
 
+# Short affirmative / negative replies to invitations - matched without calling Claude
+_YES_RE = re.compile(r"\s*(y|ya|yes|yeah|yea|yep|yup|sure|ok|okay|k|sounds good|i'?m in|count me in|👍|✅)\s*[!.?]*\s*", re.I)
+_NO_RE = re.compile(r"\s*(n|no|nope|nah|pass|no thanks|not today|i'?m out|👎|❌)\s*[!.?]*\s*", re.I)
+
+# Let Claude pick the next negotiation step (A/B switch; deterministic rules otherwise)
+USE_LLM_NEGOTIATION_DECISION = os.getenv('USE_LLM_NEGOTIATION_DECISION', 'false').lower() == 'true'
+# Negotiation invitations are templated unless this is on (kept for A/B testing)
+USE_LLM_NEGOTIATION = os.getenv('USE_LLM_NEGOTIATION', 'false').lower() == 'true'
+
+# Output caps for short Claude replies (latency grows with output tokens; an SMS is ~40 tokens)
+LABEL_MAX_TOKENS = 20        # one-word intent labels
+TIME_MAX_TOKENS = 60         # a single delivery time
+INVITE_MAX_TOKENS = 80       # <=160-char invitation
+SMS_MAX_TOKENS = 120         # one friendly SMS
+FAQ_MAX_TOKENS = 400         # FAQ answers (the 5-step "how it works" flow is the longest)
+
 # LangGraph imports
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.tools import tool
-from langchain_anthropic import ChatAnthropic
 
-# External services
-from twilio.rest import Client
-import firebase_admin
-from firebase_admin import credentials, firestore
+# External services (clients are built lazily on first use, see pangea_services)
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import AlreadyExists
 from flask import Flask, request
 
 load_dotenv() 
 
-# Initialize services with 2025 best practices
-twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+# Sender number read once at import instead of on every outbound SMS
+TWILIO_FROM = os.getenv('TWILIO_PHONE_NUMBER')
+
+# Debug-only detail goes through logging so it costs nothing unless LOG_LEVEL=DEBUG. The root
+# logger is only configured by the entry points (configure_logging), never on import
+logger = logging.getLogger(__name__)
+
+def configure_logging():
+    """Set up root logging from LOG_LEVEL - called by __main__ and the gunicorn app factory"""
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+
+# Shared clients; each is constructed on first attribute access, not at import
+from pangea_services import twilio_client, anthropic_llm, db
+
+def json_loads(text):
+    """Parse JSON (model output, stored payloads) with orjson when available"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def extract_json_text(text: str) -> str:
+    """Cut the outermost {...} out of a model reply (drops ```json fences and chatter around it)"""
+    # Same span a greedy r'\{.*\}' DOTALL search finds, via two C-level scans instead of a regex
+    start = text.find('{')
+    end = text.rfind('}')
+    if start == -1 or end < start:
+        return text.replace('```', '').strip()
+    return text[start:end + 1]
+
+def json_dumps(data) -> str:
+    """Compact JSON for prompts; datetimes and other objects fall back to str()"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, default=str)
+
+def format_prompt_fields(data: Dict) -> str:
+    """Render a flat dict as compact key=value text for a prompt (fewer tokens than JSON)"""
+    return ", ".join(
+        f"{key}={'/'.join(map(str, value)) if isinstance(value, (list, tuple)) else value}"
+        for key, value in data.items()
+    )
 
-# Use Claude Opus 4 with extended thinking and tool use capabilities
-anthropic_llm = ChatAnthropic(
-    model="claude-opus-4-20250514",
-    api_key=os.getenv('ANTHROPIC_API_KEY'),
-    temperature=0.1,
-    max_tokens=4096
-)
+def cached_system_message(text: str) -> SystemMessage:
+    """Wrap a static prompt block so Anthropic prompt caching can reuse it across calls"""
+    return SystemMessage(content=[{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}])
+
+class _TTLCache:
+    """Small thread-safe in-process cache whose entries expire after ttl seconds"""
+    
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                # Evict the entry closest to expiry (dicts keep insertion order, so this is the oldest)
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Analytics/learning writes nobody waits on run here, off the request thread
+_LOG_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pangea-log")
+
+# Short-lived fan-outs inside a request (parallel lookups, counter-proposal searches,
+# per-member setup) share one pool instead of spinning up threads per call.
+# Work submitted here must not itself wait on other _EXEC tasks, or a full pool deadlocks.
+_EXEC = ThreadPoolExecutor(max_workers=16, thread_name_prefix="pangea")
+
+# Follow-ups that finish after the reply has gone out (counter-proposals after a NO).
+# Kept apart from _EXEC because these wait on _EXEC fan-outs themselves.
+_FOLLOWUP_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pangea-followup")
+
+def _log_failures(func, *args, **kwargs):
+    """Run func for a background pool; failures are logged, never raised"""
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        print(f"❌ Background {getattr(func, 'name', getattr(func, '__name__', 'task'))} failed: {e}")
 
-# Initialize Firebase (only if not already initialized)
-if not firebase_admin._apps:
-    cred = credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
+def run_in_background(func, *args, **kwargs) -> Future:
+    """Fire-and-forget a side-effect write; failures are logged, never raised"""
+    return _LOG_EXECUTOR.submit(_log_failures, func, *args, **kwargs)
+
+# Outbound SMS is delivered from a background pool so graph nodes never block on
+# Claude/Twilio latency. Messages to the same phone are chained to keep their order.
+_msg_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="pangea-sms")
+_msg_chain_lock = threading.Lock()
+_last_msg_future: Dict[str, Future] = {}
 
 # State for LangGraph
 class PangeaState(TypedDict):
@@ -77,23 +203,109 @@ class PangeaState(TypedDict):
     proactive_notification_data: Optional[Dict]  # Store proactive notification data
 
 
+FIRESTORE_BATCH_LIMIT = 500  # Max writes in one Firestore WriteBatch
+
+def _batched_writes(ops) -> int:
+    """Apply (doc_ref, update_data) pairs in WriteBatch commits of up to 500; None data deletes.
+    
+    Returns the number of writes committed.
+    """
+    batch = db.batch()
+    pending = 0
+    written = 0
+    for ref, data in ops:
+        if data is None:
+            batch.delete(ref)
+        else:
+            batch.update(ref, data)
+        pending += 1
+        if pending == FIRESTORE_BATCH_LIMIT:
+            batch.commit()
+            written += pending
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+        written += pending
+    return written
+
+def _batched_delete(refs) -> int:
+    """Delete document refs in chunked WriteBatch commits instead of one RTT per doc"""
+    return _batched_writes((ref, None) for ref in refs)
+
+CLEANUP_LOCK_TTL = timedelta(minutes=4)  # Shorter than the 5-minute schedule so a crashed run can't block the next
+
 def cleanup_stale_sessions():
-    """Clean up old order sessions (call this periodically)"""
+    """Clean up old order sessions (run by Cloud Scheduler via /tasks/cleanup, not per request)"""
     try:
         cutoff_time = datetime.now() - timedelta(hours=2)
-        stale_sessions = db.collection('order_sessions')\
-                          .where('created_at', '<', cutoff_time)\
-                          .get()
+        # Page through with a cursor so a large backlog never becomes one unbounded scan
+        # (only created_at is selected - the cursor needs it; offset() would bill skipped docs)
+        stale_query = db.collection('order_sessions')\
+                        .where('created_at', '<', cutoff_time)\
+                        .order_by('created_at')\
+                        .select(['created_at'])\
+                        .limit(FIRESTORE_BATCH_LIMIT)
+        
+        deleted = 0
+        last_snapshot = None
+        while True:
+            page_query = stale_query.start_after(last_snapshot) if last_snapshot else stale_query
+            page = page_query.get()
+            if page:
+                deleted += _batched_delete(session.reference for session in page)
+                last_snapshot = page[-1]
+            if len(page) < FIRESTORE_BATCH_LIMIT:
+                break
         
-        for session in stale_sessions:
-            session.reference.delete()
-            print(f"🗑️ Cleaned up stale session: {session.id}")
+        print(f"🗑️ Cleaned up {deleted} stale sessions")
+        return deleted
             
     except Exception as e:
         print(f"❌ Cleanup failed: {e}")
+        return 0
+
+@firestore.transactional
+def acquire_job_lock(transaction, lock_ref, holder: str, ttl: timedelta) -> bool:
+    """Take locks/{job} unless another worker holds an unexpired lease on it"""
+    now = datetime.now(timezone.utc)
+    lock_snapshot = lock_ref.get(transaction=transaction)
+    if lock_snapshot.exists:
+        expires_at = (lock_snapshot.to_dict() or {}).get('expires_at')
+        if expires_at and expires_at > now:
+            return False
+    transaction.set(lock_ref, {'holder': holder, 'acquired_at': now, 'expires_at': now + ttl})
+    return True
+
+@firestore.transactional
+def release_job_lock(transaction, lock_ref, holder: str) -> bool:
+    """Delete locks/{job} only if this worker still holds it (an expired lease may have been re-taken)"""
+    lock_snapshot = lock_ref.get(transaction=transaction)
+    if not lock_snapshot.exists or (lock_snapshot.to_dict() or {}).get('holder') != holder:
+        return False
+    transaction.delete(lock_ref)
+    return True
+
+def run_scheduled_cleanup() -> Dict:
+    """Cleanup entry point for Cloud Scheduler; overlapping runs are deduped with a lock doc"""
+    lock_ref = db.collection('locks').document('cleanup')
+    holder = f"{os.uname().nodename}:{os.getpid()}"
+    if not acquire_job_lock(db.transaction(), lock_ref, holder, CLEANUP_LOCK_TTL):
+        print("⏭️ Cleanup already running elsewhere, skipping")
+        return {'status': 'skipped'}
+    
+    try:
+        deleted = cleanup_stale_sessions()
+        return {'status': 'ok', 'deleted_sessions': deleted}
+    finally:
+        if not release_job_lock(db.transaction(), lock_ref, holder):
+            print("⚠️ Cleanup lock was taken over by another worker, leaving it in place")
 
 
 
+# Preferences barely change within a conversation; every write to users/{phone} pops the entry
+_prefs_cache = _TTLCache(ttl=60, maxsize=10000)
+
 # Tools following 2025 MCP best practices and Claude 4 capabilities
 @tool
 def get_user_preferences(phone_number: str) -> Dict:
@@ -112,17 +324,34 @@ def get_user_preferences(phone_number: str) -> Dict:
         preferences = get_user_preferences("+1234567890")
         # Returns: {"favorite_cuisines": ["Mexican", "Pizza"], "usual_locations": ["Student Union"]}
     """
+    return load_user_preferences(phone_number)
+
+def load_user_preferences(phone_number: str) -> Dict:
+    """Plain-function body of get_user_preferences, served from the 60s prefs cache"""
+    # Callers get deep copies: the nested preferences/successful_matches are shared with every
+    # thread reading the cache, so one caller mutating them must not change the cached entry
+    cached = _prefs_cache.get(phone_number)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    
     try:
-        user_doc = db.collection('users').document(phone_number).get()
+        user_doc = db.collection('users').document(phone_number).get(
+            field_paths=['preferences', 'successful_matches', 'preferred_times', 'satisfaction_scores',
+                         'successful_partners']
+        )
         if user_doc.exists:
-            user_data = user_doc.to_dict()
-            return {
+            user_data = user_doc.to_dict() or {}
+            result = {
                 'preferences': user_data.get('preferences', {}),
                 'successful_matches': user_data.get('successful_matches', []),
                 'preferred_times': user_data.get('preferred_times', []),
-                'satisfaction_scores': user_data.get('satisfaction_scores', [])
+                'satisfaction_scores': user_data.get('satisfaction_scores', []),
+                'successful_partners': user_data.get('successful_partners', [])
             }
-        return {'preferences': {}, 'new_user': True}
+        else:
+            result = {'preferences': {}, 'new_user': True}
+        _prefs_cache.set(phone_number, result)
+        return copy.deepcopy(result)
     except Exception as e:
         return {'error': f'Failed to retrieve preferences: {str(e)}'}
 
@@ -132,143 +361,150 @@ def cleanup_all_user_data(user_phone: str):
     
     try:
         # 1. Remove from ANY active groups (fake or real matches)
-        user_groups = db.collection('active_groups')\
-                       .where('members', 'array_contains', user_phone)\
-                       .get()
-        
-        for group in user_groups:
-            group.reference.delete()
-            print(f"🗑️ Removed user from group: {group.id}")
+        groups_query = db.collection('active_groups')\
+                        .where('members', 'array_contains', user_phone)\
+                        .select([])  # Only the refs are needed - skip the document bodies
         
         # 2. Remove their active orders
-        user_orders = db.collection('active_orders')\
-                       .where('user_phone', '==', user_phone)\
-                       .get()
+        orders_query = db.collection('active_orders')\
+                        .where('user_phone', '==', user_phone)\
+                        .select([])
         
-        for order in user_orders:
-            order.reference.delete()
-            print(f"🗑️ Removed active order: {order.id}")
-        
-        # 3. Clear their order session
-        try:
-            db.collection('order_sessions').document(user_phone).delete()
-            print(f"🗑️ Cleared order session")
-        except:
-            pass  # OK if no session exists
+        # 3. Clear their order session (a batched delete of a missing doc is a no-op)
+        session_ref = db.collection('order_sessions').document(user_phone)
+        # ...and the group-size counter from their previous request
+        group_counter_ref = db.collection('negotiation_groups').document(user_phone)
         
         # 4. Cancel any pending negotiations
-        pending_negotiations = db.collection('negotiations')\
-                               .where('to_user', '==', user_phone)\
-                               .where('status', '==', 'pending')\
-                               .get()
-        
-        for neg in pending_negotiations:
-            neg.reference.update({'status': 'cancelled_new_request'})
-            print(f"🗑️ Cancelled pending negotiation: {neg.id}")
+        negotiations_query = db.collection('negotiations')\
+                              .where('to_user', '==', user_phone)\
+                              .where('status', '==', 'pending')\
+                              .select([])
+        
+        # The three lookups are independent - run them concurrently on the shared client
+        groups_future = _EXEC.submit(groups_query.get)
+        orders_future = _EXEC.submit(orders_query.get)
+        negotiations_future = _EXEC.submit(negotiations_query.get)
+        user_groups = groups_future.result()
+        user_orders = orders_future.result()
+        pending_negotiations = negotiations_future.result()
+        
+        def cleanup_ops():
+            for group in user_groups:
+                print(f"🗑️ Removing user from group: {group.id}")
+                yield group.reference, None
+            for order in user_orders:
+                print(f"🗑️ Removing active order: {order.id}")
+                yield order.reference, None
+            yield session_ref, None
+            yield group_counter_ref, None
+            for neg in pending_negotiations:
+                print(f"🗑️ Cancelling pending negotiation: {neg.id}")
+                yield neg.reference, {'status': 'cancelled_new_request'}
+        
+        # Every delete/update goes out in one batch commit instead of one RTT per doc
+        _batched_writes(cleanup_ops())
             
         print(f"✅ Complete cleanup finished for {user_phone}")
         
     except Exception as e:
         print(f"❌ Cleanup failed for {user_phone}: {e}")
 
+# Backoff (seconds) while waiting for concurrently written orders to show up; sums to 1.5s
+MATCH_RETRY_DELAYS = (0.1, 0.2, 0.4, 0.8)
+
+# Orders older than this are stale and never matched
+MATCH_ORDER_MAX_AGE = timedelta(minutes=30)
+
+# active_orders fields read while scoring candidates
+MATCH_ORDER_FIELDS = ['user_phone', 'restaurant', 'location', 'time_requested', 'created_at', 'flexibility_score']
+
 # Replace find_potential_matches function with direct calls
 def find_potential_matches(
    restaurant_preference: str,
    location: str, 
    time_window: str,
    requesting_user: str,
-   flexibility_score: float = 0.5
+   flexibility_score: float = 0.5,
+   wait_for_orders: bool = True
 ) -> List[Dict]:
-   """Find compatible users for group food orders using database filtering."""
+   """Find compatible users for group food orders using database filtering.
    
-   print(f"🔍 SEARCHING:")
-   print(f"   Looking for: '{restaurant_preference}' at '{location}' ({time_window})")
-   print(f"   Excluding: {requesting_user}")
+   wait_for_orders=False skips the empty-location probe backoff (counter-proposal sweeps).
+   """
    
-   # Add delay for spontaneous matching to allow database writes to complete
-   import time
-   time.sleep(1.5)
-   print(f"⏱️ Added search delay for spontaneous matching reliability")
+   logger.info("🔍 SEARCHING: '%s' at '%s' (%s), excluding %s", restaurant_preference, location, time_window, requesting_user)
    
    try:
        matches = []
        
-       # Query database for potential candidates
+       # Query database for potential candidates - only orders from the last 30 minutes, newest
+       # first (composite index: location, status, created_at DESC in firestore.indexes.json).
+       # created_at is the only inequality, so self-matches are skipped in Python below.
+       cutoff = datetime.now() - MATCH_ORDER_MAX_AGE
        orders_ref = db.collection('active_orders')
-       similar_orders = orders_ref.where('location', '==', location)\
-                                 .where('status', '==', 'looking_for_group')\
-                                 .where('user_phone', '!=', requesting_user)\
-                                 .limit(10).get()
+       open_orders = orders_ref.where('location', '==', location)\
+                               .where('status', '==', 'looking_for_group')\
+                               .where('created_at', '>=', cutoff)
        
-       print(f"📊 Found {len(similar_orders)} potential orders in database")
+       # Off-peak most locations have nobody waiting: a limit(2) probe reading only user_phone
+       # answers "is anyone else here?" without pulling candidate documents. Two rows because
+       # the requester's own order is usually one of them. Sorted DESC like the fetch below so
+       # both use the same composite index (Firestore indexes only serve their own direction).
+       # Another user's order may still be landing (two people texting at once), so the probe
+       # is retried with backoff - capped at 1.5s total - before giving up
+       probe = open_orders.order_by('created_at', direction=firestore.Query.DESCENDING)\
+                          .select(['user_phone'])\
+                          .limit(2)
        
-       # Filter out old orders with MORE AGGRESSIVE filtering
-       current_time = datetime.now()
-       filtered_orders = []
-
+       def someone_else_waiting() -> bool:
+           return any((row.to_dict() or {}).get('user_phone') != requesting_user for row in probe.get())
+       
+       has_candidates = someone_else_waiting()
+       for delay in (MATCH_RETRY_DELAYS if wait_for_orders else ()):
+           if has_candidates:
+               break
+           time.sleep(delay)
+           has_candidates = someone_else_waiting()
+       
+       if not has_candidates:
+           logger.info("📊 No open orders at %s - skipping candidate fetch", location)
+           return []
+       
+       similar_orders = open_orders.order_by('created_at', direction=firestore.Query.DESCENDING)\
+                                   .select(MATCH_ORDER_FIELDS)\
+                                   .limit(11)\
+                                   .get()  # 10 candidates + room for the requester's own order
+       
+       logger.info("📊 Found %s potential orders in database", len(similar_orders))
+       
+       # Staleness is filtered by the query itself (created_at >= cutoff), so every order
+       # here is under 30 minutes old and from the current meal period.
+       # Filtering and scoring happen in one pass, one dict per (projected) snapshot. Every
+       # string is normalized once (the requester's before the loop), and the regex time
+       # fallback only runs for candidates the keyword rules can't classify
+       requester_restaurant = normalize_match_text(restaurant_preference)
+       requester_time = normalize_match_text(time_window)
+       requester_canonical = canonical_restaurant(requester_restaurant)
+       candidates_scored = 0
        for order in similar_orders:
            order_data = order.to_dict()
-           order_time = order_data.get('created_at')
-           order_time_pref = order_data.get('time_requested', 'flexible')
            
            # Safety check: prevent self-matching
            if order_data.get('user_phone') == requesting_user:
-               print(f"   🚫 Skipping self-match for {requesting_user}")
-               continue
-           
-           # Skip very old orders
-           if order_time:
-               try:
-                   # Handle timezone differences by converting both to naive datetime
-                   if hasattr(order_time, 'tzinfo') and order_time.tzinfo is not None:
-                       order_time = order_time.replace(tzinfo=None)
-                   
-                   if hasattr(current_time, 'tzinfo') and current_time.tzinfo is not None:
-                       current_time = current_time.replace(tzinfo=None)
-                   
-                   time_diff = current_time - order_time
-                   
-                   # FIXED: More aggressive cleanup - ANY order older than 30 minutes is stale
-                   if time_diff > timedelta(minutes=30):
-                       print(f"   ⏰ Skipping stale order: {order_time_pref} from {time_diff} ago (user: {order_data.get('user_phone')})")
-                       continue
-                       
-                   # ADDITIONAL: Skip orders from different meal periods
-                   order_hour = order_time.hour
-                   current_hour = current_time.hour
-                   
-                   # If order is from a different meal period (more than 4 hours apart), skip it
-                   hour_diff = abs(current_hour - order_hour)
-                   if hour_diff > 4 and hour_diff < 20:  # Avoid midnight wraparound issues
-                       print(f"   🍽️ Skipping order from different meal period: {order_hour}:00 vs {current_hour}:00")
-                       continue
-                       
-               except Exception as e:
-                   print(f"   ⚠️ Error comparing times, skipping problematic order: {e}")
-                   continue  # Skip problematic orders instead of including them
-           else:
-               # No timestamp - this is suspicious, skip it
-               print(f"   ❌ Skipping order with no timestamp: {order_data}")
+               logger.debug("   🚫 Skipping self-match for %s", requesting_user)
                continue
            
-           filtered_orders.append(order)
-       
-       print(f"📊 After aggressive time filtering: {len(filtered_orders)} potential orders")
-       
-       # Use calculate_compatibility to score each candidate
-       for order in filtered_orders:
-           order_data = order.to_dict()
-           print(f"   Checking: {order_data}")
+           candidates_scored += 1
+           logger.debug("   Checking: %s", order_data)
            
-           # Call calculate_compatibility using .invoke() method for @tool decorated function
-           compatibility_score = calculate_compatibility.invoke({
-               "user1_restaurant": restaurant_preference,
-               "user1_time": time_window,
-               "user2_restaurant": order_data.get('restaurant', ''),
-               "user2_time": order_data.get('time_requested', 'flexible'),
-               "user1_phone": requesting_user,
-               "user2_phone": order_data['user_phone']
-           })
+           compatibility_score = score_normalized_compatibility(
+               requester_restaurant,
+               requester_time,
+               normalize_match_text(order_data.get('restaurant', '')),
+               normalize_match_text(order_data.get('time_requested', 'flexible')),
+               rest1_canonical=requester_canonical
+           )
            
            # Only include matches above threshold
            if compatibility_score >= 0.3:
@@ -281,17 +517,19 @@ def find_potential_matches(
                    'user_flexibility': order_data.get('flexibility_score', 0.5)
                }
                matches.append(match)
-               print(f"   ✅ MATCH: {match}")
+               logger.debug("   ✅ MATCH: %s", match)
            else:
-               print(f"   ❌ No match: score {compatibility_score}")
+               logger.debug("   ❌ No match: score %s", compatibility_score)
+       
+       logger.info("📊 After self-match filtering: %s potential orders", candidates_scored)
        
        # Sort by compatibility score (best matches first)
        matches.sort(key=lambda x: x['compatibility_score'], reverse=True)
-       print(f"🎯 Final matches: {len(matches[:3])}")
+       logger.info("🎯 Final matches: %s", len(matches[:3]))
        return matches[:3]  # Return top 3 matches
        
    except Exception as e:
-       print(f"❌ Matching failed: {e}")
+       logger.error("❌ Matching failed: %s", e)
        return []
 
 
@@ -305,69 +543,110 @@ def calculate_compatibility(
     user2_phone: str = ""
 ) -> float:
     """Calculate compatibility between two users' food orders using deterministic logic first"""
+    return score_compatibility(user1_restaurant, user1_time, user2_restaurant, user2_time)
+
+def normalize_match_text(text: str) -> str:
+    """Lowercase/strip a restaurant or time string once, before it is compared"""
+    return text.lower().strip()
+
+def score_compatibility(user1_restaurant: str, user1_time: str, user2_restaurant: str, user2_time: str,
+                        user1_canonical: Optional[str] = None) -> float:
+    """Plain-function body of calculate_compatibility (no tool-call overhead).
+    
+    Pass user1_canonical (from canonical_restaurant) when scoring many candidates
+    against the same requester so their restaurant is only resolved once.
+    """
+    return score_normalized_compatibility(
+        normalize_match_text(user1_restaurant),
+        normalize_match_text(user1_time),
+        normalize_match_text(user2_restaurant),
+        normalize_match_text(user2_time),
+        user1_canonical
+    )
+
+def score_normalized_compatibility(rest1: str, time1: str, rest2: str, time2: str,
+                                   rest1_canonical: Optional[str] = None) -> float:
+    """score_compatibility for strings already passed through normalize_match_text"""
     
-    print(f"   🔍 Comparing: '{user1_restaurant}' vs '{user2_restaurant}'")
-    print(f"   🕐 Times: '{user1_time}' vs '{user2_time}'")
+    logger.debug("   🔍 Comparing: '%s' vs '%s'", rest1, rest2)
+    logger.debug("   🕐 Times: '%s' vs '%s'", time1, time2)
     
     # RULE 1: DIFFERENT RESTAURANTS = AUTOMATIC 0.0 (NO EXCEPTIONS)
-    if not restaurants_match(user1_restaurant, user2_restaurant):
-        print(f"   ❌ Different restaurants - automatic 0.0")
+    if not _normalized_restaurants_match(rest1, rest2, rest1_canonical):
+        logger.debug("   ❌ Different restaurants - automatic 0.0")
         return 0.0
     
     # RULE 2: If restaurants match, check time compatibility
-    time_score = calculate_time_compatibility(user1_time, user2_time)
-    print(f"   ⏰ Time compatibility: {time_score}")
+    # (uncertain cases are settled by the regex fallback inside - no LLM call)
+    final_score = _normalized_time_compatibility(time1, time2)
     
-    # Only use LLM for edge cases if needed
-    if time_score == 0.5:  # Uncertain cases only
-        llm_score = get_llm_time_assessment(user1_time, user2_time)
-        final_score = llm_score
-    else:
-        final_score = time_score
-    
-    print(f"   ✅ Final compatibility score: {final_score}")
+    logger.debug("   ✅ Final compatibility score: %s", final_score)
     return final_score
 
-def restaurants_match(rest1: str, rest2: str) -> bool:
-    """Deterministic restaurant matching - no LLM needed"""
-    
-    # Clean and normalize
-    rest1_clean = rest1.lower().strip()
-    rest2_clean = rest2.lower().strip()
-    
-    # Exact match
-    if rest1_clean == rest2_clean:
-        return True
-    
-    # Known restaurant mappings (deterministic)
-    restaurant_aliases = {
+# Known restaurant mappings (deterministic)
+RESTAURANT_ALIASES = {
     "chipotle": ["chipotle", "mexican", "burrito", "bowl"],
     "mcdonald's": ["mcdonald", "mcdonalds", "mcd", "burger", "fries"],
     "chick-fil-a": ["chickfila", "chick", "chicken", "sandwich"],
     "portillo's": ["portillos", "italian beef", "hot dog", "chicago"],
     "starbucks": ["starbucks", "coffee", "latte", "frappuccino"]
 }
+
+# Inverted index built once: alias -> (priority, canonical). On ties the later restaurant in
+# RESTAURANT_ALIASES wins, as the old substring scan did ("chicken burrito" -> chick-fil-a)
+_ALIAS_TO_CANONICAL = {
+    alias: (priority, canonical)
+    for priority, (canonical, aliases) in enumerate(RESTAURANT_ALIASES.items())
+    for alias in aliases
+}
+_RESTAURANT_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Substring fallback for compounds and irregular plurals the token probes miss ("cheeseburger",
+# "sandwiches", "chickfil-a"): aliases in descending priority, so the first hit is the old answer
+_ALIASES_BY_PRIORITY = sorted(
+    ((priority, alias, canonical) for alias, (priority, canonical) in _ALIAS_TO_CANONICAL.items()),
+    reverse=True
+)
+
+def canonical_restaurant(restaurant: str) -> Optional[str]:
+    """Map free-text restaurant names onto a canonical restaurant via the alias index"""
+    restaurant_clean = restaurant.lower().replace("'", "")
+    tokens = _RESTAURANT_TOKEN_RE.findall(restaurant_clean)
+    singulars = [token[:-1] for token in tokens if token.endswith('s')]
+    # Probe single tokens, their singular form ("burgers"), and bigrams ("hot dog", "hot dogs")
+    probes = tokens + singulars + \
+             [f"{first} {second}" for first, second in zip(tokens, tokens[1:])] + \
+             [f"{first} {second[:-1]}" for first, second in zip(tokens, tokens[1:]) if second.endswith('s')]
+    hits = [_ALIAS_TO_CANONICAL[probe] for probe in probes if probe in _ALIAS_TO_CANONICAL]
+    if hits:
+        return max(hits)[1]
+    
+    squashed = " ".join(tokens)  # "hot-dog" -> "hot dog"
+    return next((canonical for _, alias, canonical in _ALIASES_BY_PRIORITY
+                 if alias in squashed or alias in restaurant_clean), None)
+
+def restaurants_match(rest1: str, rest2: str, rest1_canonical: Optional[str] = None) -> bool:
+    """Deterministic restaurant matching - no LLM needed"""
+    return _normalized_restaurants_match(normalize_match_text(rest1), normalize_match_text(rest2), rest1_canonical)
+
+def _normalized_restaurants_match(rest1_clean: str, rest2_clean: str, rest1_canonical: Optional[str] = None) -> bool:
+    # Exact match
+    if rest1_clean == rest2_clean:
+        return True
     
     # Check if both restaurants map to the same canonical restaurant
-    rest1_canonical = None
-    rest2_canonical = None
-    
-    for canonical, aliases in restaurant_aliases.items():
-        if any(alias in rest1_clean for alias in aliases):
-            rest1_canonical = canonical
-        if any(alias in rest2_clean for alias in aliases):
-            rest2_canonical = canonical
+    if rest1_canonical is None:
+        rest1_canonical = canonical_restaurant(rest1_clean)
+    rest2_canonical = canonical_restaurant(rest2_clean)
     
     result = rest1_canonical is not None and rest1_canonical == rest2_canonical
-    print(f"   🍕 Restaurant match: {rest1_canonical} == {rest2_canonical} = {result}")
+    logger.debug("   🍕 Restaurant match: %s == %s = %s", rest1_canonical, rest2_canonical, result)
     return result
 
 def calculate_time_compatibility(time1: str, time2: str) -> float:
     """Deterministic time compatibility - clear rules"""
-    
-    time1_clean = time1.lower().strip()
-    time2_clean = time2.lower().strip()
-    
+    return _normalized_time_compatibility(normalize_match_text(time1), normalize_match_text(time2))
+
+def _normalized_time_compatibility(time1_clean: str, time2_clean: str) -> float:
     # Exact matches
     if time1_clean == time2_clean:
         return 1.0
@@ -404,23 +683,25 @@ def calculate_time_compatibility(time1: str, time2: str) -> float:
         if any(t in time1_clean for t in time_group) and any(t in time2_clean for t in time_group):
             return 0.8
     
-    # Uncertain cases - might need LLM
-    return 0.5
+    # Uncertain cases - parse the actual hours/ranges instead of asking an LLM
+    return _regex_time_fallback(time1_clean, time2_clean)
+
+# Time patterns used per candidate while matching - compiled once
+_HOUR_RE = re.compile(r'(\d{1,2})\s*(am|pm)')
+_RANGE_RE = re.compile(r'between\s+(\d{1,2})(?::(\d{2}))?\s*(pm|am)?\s*to\s*(\d{1,2})(?::(\d{2}))?\s*(pm|am)')
+_SPECIFIC_TIME_RE = re.compile(r'(\d{1,2}):?(\d{0,2})\s*(pm|am)')
+_AROUND_RE = re.compile(r'around\s+(\d{1,2})')
 
 def has_hour_conflict(time1: str, time2: str) -> bool:
     """Check for obvious hour conflicts like 7pm vs 12am"""
     
-    import re
-    
     # Skip range times - let smart assessment handle them
     if 'between' in time1 or 'between' in time2:
         return False
     
     # Extract hours from times like "7pm", "12am", "around 7pm"
-    hour_pattern = r'(\d{1,2})\s*(am|pm)'
-    
-    match1 = re.search(hour_pattern, time1)
-    match2 = re.search(hour_pattern, time2)
+    match1 = _HOUR_RE.search(time1)
+    match2 = _HOUR_RE.search(time2)
     
     if match1 and match2:
         hour1, period1 = match1.groups()
@@ -445,70 +726,65 @@ def has_hour_conflict(time1: str, time2: str) -> bool:
             time_diff = 24 - time_diff
             
         if time_diff > 4:  # More than 4 hours apart = incompatible
-            print(f"   ⏰ Hour conflict: {hour1}:00 vs {hour2}:00 ({time_diff}h apart)")
+            logger.debug("   ⏰ Hour conflict: %s:00 vs %s:00 (%sh apart)", hour1, hour2, time_diff)
             return True
     
     return False
 
-def get_llm_time_assessment(time1: str, time2: str) -> float:
-    """Smart time matching with better heuristics and no signal timeout"""
-    
-    time1_lower = time1.lower().strip()
-    time2_lower = time2.lower().strip()
-    
-    print(f"   🧠 Smart time assessment: '{time1}' vs '{time2}'")
-    
-    # Extract hours for both times
-    import re
-    
-    def extract_hour_info(time_str):
-        """Extract hour and period info from time string"""
-        # Handle ranges like "between 6:30 pm to 7:00pm"
-        if 'between' in time_str and 'to' in time_str:
-            # Extract the range
-            range_match = re.search(r'between\s+(\d{1,2})(?::(\d{2}))?\s*(pm|am)?\s*to\s*(\d{1,2})(?::(\d{2}))?\s*(pm|am)', time_str)
-            if range_match:
-                start_hour = int(range_match.group(1))
-                start_period = range_match.group(3) or range_match.group(6) or 'pm'
-                end_hour = int(range_match.group(4))
-                end_period = range_match.group(6) or 'pm'
-                
-                # Convert to 24-hour
-                if start_period == 'pm' and start_hour != 12:
-                    start_hour += 12
-                elif start_period == 'am' and start_hour == 12:
-                    start_hour = 0
-                    
-                if end_period == 'pm' and end_hour != 12:
-                    end_hour += 12
-                elif end_period == 'am' and end_hour == 12:
-                    end_hour = 0
-                
-                return {'type': 'range', 'start': start_hour, 'end': end_hour}
-        
-        # Handle specific times like "7 pm", "7:30pm"
-        time_match = re.search(r'(\d{1,2}):?(\d{0,2})\s*(pm|am)', time_str)
-        if time_match:
-            hour = int(time_match.group(1))
-            period = time_match.group(3)
-            
-            if period == 'pm' and hour != 12:
-                hour += 12
-            elif period == 'am' and hour == 12:
-                hour = 0
+def extract_hour_info(time_str: str) -> Optional[Dict]:
+    """Extract hour and period info from a lowercased time string"""
+    # Handle ranges like "between 6:30 pm to 7:00pm"
+    if 'between' in time_str and 'to' in time_str:
+        # Extract the range
+        range_match = _RANGE_RE.search(time_str)
+        if range_match:
+            start_hour = int(range_match.group(1))
+            start_period = range_match.group(3) or range_match.group(6) or 'pm'
+            end_hour = int(range_match.group(4))
+            end_period = range_match.group(6) or 'pm'
+            
+            # Convert to 24-hour
+            if start_period == 'pm' and start_hour != 12:
+                start_hour += 12
+            elif start_period == 'am' and start_hour == 12:
+                start_hour = 0
                 
-            return {'type': 'specific', 'hour': hour}
-        
-        # Handle "around X" patterns
-        around_match = re.search(r'around\s+(\d{1,2})', time_str)
-        if around_match:
-            hour = int(around_match.group(1))
-            # Default to PM for dinner hours
-            if hour >= 1 and hour <= 7:
-                hour += 12
-            return {'type': 'around', 'hour': hour}
+            if end_period == 'pm' and end_hour != 12:
+                end_hour += 12
+            elif end_period == 'am' and end_hour == 12:
+                end_hour = 0
             
-        return None
+            return {'type': 'range', 'start': start_hour, 'end': end_hour}
+    
+    # Handle specific times like "7 pm", "7:30pm"
+    time_match = _SPECIFIC_TIME_RE.search(time_str)
+    if time_match:
+        hour = int(time_match.group(1))
+        period = time_match.group(3)
+        
+        if period == 'pm' and hour != 12:
+            hour += 12
+        elif period == 'am' and hour == 12:
+            hour = 0
+            
+        return {'type': 'specific', 'hour': hour}
+    
+    # Handle "around X" patterns
+    around_match = _AROUND_RE.search(time_str)
+    if around_match:
+        hour = int(around_match.group(1))
+        # Default to PM for dinner hours
+        if hour >= 1 and hour <= 7:
+            hour += 12
+        return {'type': 'around', 'hour': hour}
+        
+    return None
+
+@lru_cache(maxsize=2048)  # Pure function of the two strings, evaluated per candidate pair
+def _regex_time_fallback(time1_lower: str, time2_lower: str) -> float:
+    """Settle times calculate_time_compatibility can't classify by parsing hours and ranges"""
+    
+    logger.debug("   🧠 Regex time fallback: '%s' vs '%s'", time1_lower, time2_lower)
     
     time1_info = extract_hour_info(time1_lower)
     time2_info = extract_hour_info(time2_lower)
@@ -517,21 +793,21 @@ def get_llm_time_assessment(time1: str, time2: str) -> float:
         # Range vs specific time
         if time1_info['type'] == 'range' and time2_info['type'] == 'specific':
             if time1_info['start'] <= time2_info['hour'] <= time1_info['end']:
-                print(f"   ✅ Specific time {time2_info['hour']} falls in range {time1_info['start']}-{time1_info['end']}")
+                logger.debug("   ✅ Specific time %s falls in range %s-%s", time2_info['hour'], time1_info['start'], time1_info['end'])
                 return 1.0
         elif time2_info['type'] == 'range' and time1_info['type'] == 'specific':
             if time2_info['start'] <= time1_info['hour'] <= time2_info['end']:
-                print(f"   ✅ Specific time {time1_info['hour']} falls in range {time2_info['start']}-{time2_info['end']}")
+                logger.debug("   ✅ Specific time %s falls in range %s-%s", time1_info['hour'], time2_info['start'], time2_info['end'])
                 return 1.0
         
         # Both specific times
         elif time1_info['type'] == 'specific' and time2_info['type'] == 'specific':
             time_diff = abs(time1_info['hour'] - time2_info['hour'])
             if time_diff == 0:
-                print(f"   ✅ Exact time match: {time1_info['hour']}")
+                logger.debug("   ✅ Exact time match: %s", time1_info['hour'])
                 return 1.0
             elif time_diff <= 1:
-                print(f"   ✅ Close time match: {time_diff}h difference")
+                logger.debug("   ✅ Close time match: %sh difference", time_diff)
                 return 0.8
         
         # Around + specific or range
@@ -542,26 +818,26 @@ def get_llm_time_assessment(time1: str, time2: str) -> float:
             # Handle range + around
             if time1_info.get('type') == 'range':
                 if time1_info['start'] <= h2 <= time1_info['end']:
-                    print(f"   ✅ Around time {h2} falls in range {time1_info['start']}-{time1_info['end']}")
+                    logger.debug("   ✅ Around time %s falls in range %s-%s", h2, time1_info['start'], time1_info['end'])
                     return 0.9
             elif time2_info.get('type') == 'range':
                 if time2_info['start'] <= h1 <= time2_info['end']:
-                    print(f"   ✅ Around time {h1} falls in range {time2_info['start']}-{time2_info['end']}")
+                    logger.debug("   ✅ Around time %s falls in range %s-%s", h1, time2_info['start'], time2_info['end'])
                     return 0.9
             else:
                 # Both specific or around
                 time_diff = abs(h1 - h2)
                 if time_diff <= 1:
-                    print(f"   ✅ Around match: {time_diff}h difference")
+                    logger.debug("   ✅ Around match: %sh difference", time_diff)
                     return 0.9
     
     # Fallback to simple text matching
     # If both mention same time period, likely compatible
     if any(period in time1_lower and period in time2_lower for period in ['morning', 'lunch', 'dinner', 'evening']):
-        print(f"   ⚡ Quick match on time period")
+        logger.debug("   ⚡ Quick match on time period")
         return 1.0
     
-    print(f"   ❌ No clear time match found")
+    logger.debug("   ❌ No clear time match found")
     return 0.0
 
 def simple_compatibility_check(pref1: str, pref2: str, time1: str, time2: str) -> float:
@@ -569,38 +845,31 @@ def simple_compatibility_check(pref1: str, pref2: str, time1: str, time2: str) -
     
     # Basic restaurant matching
     if pref1.lower().strip() == pref2.lower().strip():
-        print(f"   ✅ Exact restaurant match")
+        logger.debug("   ✅ Exact restaurant match")
         return 0.9
     elif "mario" in pref1.lower() and "mario" in pref2.lower():
-        print(f"   🍕 Mario's Pizza match")
+        logger.debug("   🍕 Mario's Pizza match")
         return 0.9
     elif "thai" in pref1.lower() and "thai" in pref2.lower():
-        print(f"   🍜 Thai food match")
+        logger.debug("   🍜 Thai food match")
         return 0.9
     elif "pizza" in pref1.lower() and "pizza" in pref2.lower():
-        print(f"   🍕 Pizza match")
+        logger.debug("   🍕 Pizza match")
         return 0.8
     elif "sushi" in pref1.lower() and "sushi" in pref2.lower():
-        print(f"   🍣 Sushi match")
+        logger.debug("   🍣 Sushi match")
         return 0.8
     else:
-        print(f"   ❌ No restaurant match found")
+        logger.debug("   ❌ No restaurant match found")
         return 0.0
 
 def check_historical_compatibility(user1: str, user2: str) -> float:
     """Check if users have successfully ordered together before"""
-    try:
-        # Query successful group orders containing both users
-        successful_orders = db.collection('completed_orders')\
-                             .where('participants', 'array_contains', user1)\
-                             .where('status', '==', 'successful').get()
-        
-        for order in successful_orders:
-            if user2 in order.to_dict().get('participants', []):
-                return 1.0  # Perfect score if they've ordered together successfully
-        return 0.5  # Neutral if no history
-    except:
-        return 0.5
+    # Partners are denormalized onto users/{phone}.successful_partners when a group forms,
+    # so this is a membership test on the cached preferences - no query per candidate
+    if user2 in load_user_preferences(user1).get('successful_partners', []):
+        return 1.0  # Perfect score if they've ordered together successfully
+    return 0.5  # Neutral if no history
 
 def calculate_restaurant_similarity(pref1: str, pref2: str) -> float:
     """Calculate similarity between restaurant preferences"""
@@ -626,6 +895,21 @@ def calculate_restaurant_similarity(pref1: str, pref2: str) -> float:
     
     return 0.2  # Low but non-zero for flexibility
 
+# At most this many of a user's negotiations may be pending at once. Recent ones only, so
+# invitations nobody answered stop counting once they are as stale as their orders
+MAX_PENDING_NEGOTIATIONS = int(os.getenv('MAX_PENDING_NEGOTIATIONS', '3'))
+NEGOTIATION_PENDING_WINDOW = timedelta(minutes=30)
+
+def count_pending_negotiations(requesting_user: str) -> int:
+    """Server-side count of the requester's recent negotiations still awaiting a reply"""
+    cutoff = datetime.now() - NEGOTIATION_PENDING_WINDOW
+    pending_count_result = db.collection('negotiations')\
+                             .where('from_user', '==', requesting_user)\
+                             .where('status', '==', 'pending')\
+                             .where('created_at', '>=', cutoff)\
+                             .count().get()
+    return int(pending_count_result[0][0].value)
+
 def negotiate_with_other_ai(
     target_ai_user: str,
     proposal: Dict,
@@ -664,6 +948,13 @@ def negotiate_with_other_ai(
         )
     """
     try:
+        # Each negotiation costs an LLM call and several writes - bound the fan-out per user
+        # (an aggregation count is a single read)
+        requesting_user = proposal.get('requesting_user')
+        if requesting_user and count_pending_negotiations(requesting_user) >= MAX_PENDING_NEGOTIATIONS:
+            print(f"⏸️ Throttled negotiation from {requesting_user}: {MAX_PENDING_NEGOTIATIONS} already pending")
+            return {"status": "throttled", "negotiation_id": negotiation_id}
+        
         # Enhanced negotiation with learning from past interactions
         target_user_history = get_user_preferences(target_ai_user)
         
@@ -677,11 +968,20 @@ def negotiate_with_other_ai(
             'status': 'pending',
             'created_at': datetime.now(),
             'negotiation_id': negotiation_id,
-            'ai_reasoning': generate_negotiation_reasoning(proposal, target_user_history, strategy)
+            'ai_reasoning': None  # Filled in below, off the critical path
         }
         
         # Store with enhanced metadata for learning
-        db.collection('negotiations').document(negotiation_id).set(negotiation_doc)
+        negotiation_ref = db.collection('negotiations').document(negotiation_id)
+        negotiation_ref.set(negotiation_doc)
+        
+        # The reasoning is only stored for learning - nothing waits on it - so the Claude
+        # call overlaps the invitation instead of delaying it by a full LLM round-trip
+        def store_negotiation_reasoning():
+            negotiation_ref.update({
+                'ai_reasoning': generate_negotiation_reasoning(proposal, target_user_history, strategy)
+            })
+        run_in_background(store_negotiation_reasoning)
         
         # Trigger real-time notification (in production would use pub/sub)
         send_negotiation_notification(target_ai_user, negotiation_doc)
@@ -698,22 +998,37 @@ def negotiate_with_other_ai(
     except Exception as e:
         return {"status": "failed", "error": str(e)}
 
+# Facts are stated once; this runs once per match inside the negotiation loop
+NEGOTIATION_REASONING_TEMPLATE = """You are an AI Friend negotiating a group food order for your user.
+Facts:
+- Request: {restaurant} at {location}, {time}
+- Compatibility: {compatibility}
+- Strategy: {strategy}
+- Other user's preferences: {target_preferences}
+Be fair to both users. Think step by step, then output JSON with keys: primary_proposal, alternatives, incentives, reasoning."""
+
+_negotiation_reasoning_cache = _TTLCache(ttl=3600, maxsize=2048)
+
 def generate_negotiation_reasoning(proposal: Dict, target_history: Dict, strategy: str) -> str:
     """Generate AI reasoning for negotiation approach"""
     
-    reasoning_prompt = f"""
-    As an AI Friend negotiating on behalf of my user, analyze this situation:
-    
-    My user wants: {proposal.get('primary_restaurant')} at {proposal.get('time')}
-    Target user's history: {target_history.get('preferences', {})}
-    Strategy: {strategy}
+    reasoning_prompt = NEGOTIATION_REASONING_TEMPLATE.format_map({
+        'restaurant': proposal.get('primary_restaurant'),
+        'location': proposal.get('location'),
+        'time': proposal.get('time'),
+        'compatibility': proposal.get('compatibility_score', 0.5),
+        'strategy': strategy,
+        'target_preferences': target_history.get('preferences', {})
+    })
     
-    Generate a reasoning strategy for this negotiation that maximizes success probability
-    while being fair to both users. Consider alternatives and incentives.
-    """
+    # Negotiations for the same restaurant/time/strategy/preferences render the same prompt
+    cache_key = hashlib.sha1(reasoning_prompt.encode()).hexdigest()
+    cached = _negotiation_reasoning_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    # In production, this would use Claude 4's extended thinking
     response = anthropic_llm.invoke([HumanMessage(content=reasoning_prompt)])
+    _negotiation_reasoning_cache.set(cache_key, response.content)
     return response.content
 
 def calculate_negotiation_success_probability(proposal: Dict, target_history: Dict) -> float:
@@ -731,6 +1046,34 @@ def calculate_negotiation_success_probability(proposal: Dict, target_history: Di
     
     return min(base_probability, 1.0)
 
+# Built once; generate_counter_proposal only fills in the per-rejection facts (no indentation
+# or Python reprs, so fewer input tokens per call)
+COUNTER_PROPOSAL_TEMPLATE = """A user rejected this group food proposal. Should I make a counter-proposal?
+
+REJECTED PROPOSAL: restaurant={rejected_restaurant}, time={rejected_time}, location={rejected_location}
+
+USER'S COMPLETE PREFERENCES:
+- Favorite cuisines: {favorite_cuisines}
+- Usual delivery locations: {usual_locations}
+- Past successful matches: {past_matches}
+- Other preferences: {other_preferences}
+
+AVAILABLE ALTERNATIVES:
+{alternatives}
+
+DECISION CRITERIA:
+1. Only counter if alternative genuinely matches their preferences better
+2. Consider BOTH restaurant preferences AND usual delivery locations
+3. Don't be annoying - max 1 counter-proposal per rejection
+4. Respect their "no" if they seem generally uninterested
+5. Prioritize alternatives that match both cuisine AND location preferences
+
+Return JSON ONLY:
+{{"should_counter": true/false,
+"reasoning": "brief explanation including why restaurant + location is better",
+"counter_proposal": {{"restaurant": "alternative restaurant name", "location": "location", "time": "time", "why_better": "why this restaurant + location combo matches their preferences", "preference_match": "explain what preferences this matches", "user_phone": "phone of other user"}} or null,
+"user_message": "if should_counter: the SMS to send them - casual and friendly, under 320 characters, acknowledges the pass on {rejected_restaurant}, suggests the alternative restaurant, location and time, and ends by asking them to reply YES if interested. Otherwise null"}}"""
+
 def generate_counter_proposal(
     rejected_proposal: Dict,
     declining_user_preferences: Dict,
@@ -780,53 +1123,62 @@ def generate_counter_proposal(
         preferred_locations.extend(nearby_locations)
     
     # STEP 2: Search for alternatives across user's preferred cuisines AND locations
-    alternative_opportunities = []
     
-    for cuisine in preferred_cuisines[:3]:  # Check top 3 cuisines
-        for location in preferred_locations[:3]:  # Check top 3 locations ✅ Use their preferred locations
-            try:
-                print(f"🔍 Searching {cuisine} at {location}")
-                
-                matches = find_potential_matches(
-                    restaurant_preference=cuisine,
-                    location=location,
-                    time_window="flexible",  # More flexible after rejection
-                    requesting_user=user_phone
-                )
+    usual_locations = user_prefs.get('usual_locations', [])
+    favorite_cuisines = user_prefs.get('favorite_cuisines', [])
+    
+    # Deduplicated as results arrive: each user keeps their best-scoring alternative
+    # (first one wins ties), so only unique users are ranked afterwards
+    best_by_user = {}
+    
+    # Top 3 cuisines x top 3 locations ✅ Use their preferred locations. Each search is
+    # Firestore I/O, so all nine run at once. They skip the empty-location backoff: nobody is
+    # mid-text with this user here, and sleeping searches would hog the shared _EXEC workers
+    searches = [(cuisine, location) for cuisine in preferred_cuisines[:3] for location in preferred_locations[:3]]
+    search_futures = []
+    for cuisine, location in searches:
+        print(f"🔍 Searching {cuisine} at {location}")
+        search_futures.append(_EXEC.submit(
+            find_potential_matches,
+            restaurant_preference=cuisine,
+            location=location,
+            time_window="flexible",  # More flexible after rejection
+            requesting_user=user_phone,
+            wait_for_orders=False
+        ))
+    
+    # Collected in submission order so ranking ties resolve the same way every time
+    for (cuisine, location), future in zip(searches, search_futures):
+        try:
+            matches = future.result()
+            
+            # Preference flags are the same for every match from this search - work them out once
+            location_in_preferences = location in usual_locations
+            cuisine_in_preferences = cuisine in favorite_cuisines
+            # Rank by compatibility + preference matching (+0.2 preferred location, +0.2 cuisine)
+            preference_bonus = 0.2 * location_in_preferences + 0.2 * cuisine_in_preferences
+            
+            for match in matches:
+                user_phone_alt = match.get('user_phone')
+                if not user_phone_alt:
+                    continue
                 
                 # Add preference scores
-                for match in matches:
-                    match['location_in_preferences'] = location in user_prefs.get('usual_locations', [])
-                    match['cuisine_in_preferences'] = cuisine in user_prefs.get('favorite_cuisines', [])
-                
-                alternative_opportunities.extend(matches)
+                match['location_in_preferences'] = location_in_preferences
+                match['cuisine_in_preferences'] = cuisine_in_preferences
                 
-            except Exception as e:
-                print(f"⚠️ Error searching for {cuisine} at {location}: {e}")
-                continue
+                score = match.get('compatibility_score', 0) * 0.6 + preference_bonus
+                if user_phone_alt not in best_by_user or score > best_by_user[user_phone_alt][0]:
+                    best_by_user[user_phone_alt] = (score, match)
+            
+        except Exception as e:
+            print(f"⚠️ Error searching for {cuisine} at {location}: {e}")
+            continue
     
-    # Remove duplicates and sort by preference matching
-    seen_users = set()
-    unique_alternatives = []
-    
-    # Sort by compatibility + preference matching
-    def preference_score(alt):
-        score = alt.get('compatibility_score', 0) * 0.6
-        if alt.get('location_in_preferences'):
-            score += 0.2  # Bonus for preferred location
-        if alt.get('cuisine_in_preferences'):
-            score += 0.2  # Bonus for preferred cuisine
-        return score
-    
-    alternative_opportunities.sort(key=preference_score, reverse=True)
-    
-    for alt in alternative_opportunities:
-        user_phone_alt = alt.get('user_phone')
-        if user_phone_alt and user_phone_alt not in seen_users:
-            seen_users.add(user_phone_alt)
-            unique_alternatives.append(alt)
-        if len(unique_alternatives) >= 3:
-            break
+    # Top 3 unique users via a bounded heap instead of sorting everything
+    unique_alternatives = [
+        alt for _, alt in heapq.nlargest(3, best_by_user.values(), key=lambda scored: scored[0])
+    ]
     
     print(f"🎯 Found {len(unique_alternatives)} preference-aware alternatives")
     
@@ -840,71 +1192,30 @@ def generate_counter_proposal(
         }
     
     # ✅ ENHANCED: Pass ALL user preferences to Claude including location preferences
-    counter_proposal_prompt = f"""
-    A user rejected this group food proposal. Should I make a counter-proposal?
-    
-    REJECTED PROPOSAL:
-    - Restaurant: {rejected_proposal.get('restaurant', 'Unknown')}
-    - Time: {rejected_proposal.get('time', 'Unknown')}
-    - Location: {rejected_proposal.get('location', 'Unknown')}
-    
-    USER'S COMPLETE PREFERENCES:
-    - Favorite cuisines: {user_prefs.get('favorite_cuisines', [])}
-    - Usual delivery locations: {user_prefs.get('usual_locations', [])}
-    - Past successful matches: {len(declining_user_preferences.get('successful_matches', []))}
-    - Other preferences: {user_prefs}
-    
-    AVAILABLE ALTERNATIVES:
-    {json.dumps([{
-        'restaurant': alt.get('restaurant'),
-        'location': alt.get('location'), 
-        'time': alt.get('time_requested'),
-        'compatibility_score': alt.get('compatibility_score'),
-        'matches_cuisine_pref': alt.get('cuisine_in_preferences', False),
-        'matches_location_pref': alt.get('location_in_preferences', False)
-    } for alt in unique_alternatives], indent=2)}
-    
-    DECISION CRITERIA:
-    1. Only counter if alternative genuinely matches their preferences better
-    2. Consider BOTH restaurant preferences AND usual delivery locations
-    3. Don't be annoying - max 1 counter-proposal per rejection
-    4. Respect their "no" if they seem generally uninterested
-    5. Prioritize alternatives that match both cuisine AND location preferences
-    
-    Return JSON ONLY:
-    {{
-        "should_counter": true/false,
-        "reasoning": "brief explanation including why restaurant + location is better",
-        "counter_proposal": {{
-            "restaurant": "alternative restaurant name",
-            "location": "location", 
-            "time": "time",
-            "why_better": "why this restaurant + location combo matches their preferences",
-            "preference_match": "explain what preferences this matches",
-            "user_phone": "phone of other user"
-        }} or null
-    }}
-    """
+    counter_proposal_prompt = COUNTER_PROPOSAL_TEMPLATE.format_map({
+        'rejected_restaurant': rejected_proposal.get('restaurant', 'Unknown'),
+        'rejected_time': rejected_proposal.get('time', 'Unknown'),
+        'rejected_location': rejected_proposal.get('location', 'Unknown'),
+        'favorite_cuisines': ', '.join(map(str, user_prefs.get('favorite_cuisines', []))) or 'none',
+        'usual_locations': ', '.join(map(str, user_prefs.get('usual_locations', []))) or 'none',
+        'past_matches': len(declining_user_preferences.get('successful_matches', [])),
+        'other_preferences': format_prompt_fields(user_prefs),
+        'alternatives': '\n'.join('- ' + format_prompt_fields({
+            'restaurant': alt.get('restaurant'),
+            'location': alt.get('location'),
+            'time': alt.get('time_requested'),
+            'compatibility_score': alt.get('compatibility_score'),
+            'matches_cuisine_pref': alt.get('cuisine_in_preferences', False),
+            'matches_location_pref': alt.get('location_in_preferences', False)
+        }) for alt in unique_alternatives)
+    })
     
     try:
         response = anthropic_llm.invoke([HumanMessage(content=counter_proposal_prompt)])
-        response_text = response.content.strip()
-        
         # Clean up response - remove any markdown formatting
-        if '```json' in response_text:
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            response_text = response_text[start:end]
-        elif '```' in response_text:
-            response_text = response_text.replace('```', '').strip()
+        response_text = extract_json_text(response.content.strip())
         
-        if not response_text.startswith('{'):
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group()
-        
-        result = json.loads(response_text)
+        result = json_loads(response_text)
         
         # Validate the response structure
         if not isinstance(result.get('should_counter'), bool):
@@ -926,18 +1237,18 @@ def generate_counter_proposal(
             rejected_proposal, declining_user_preferences, unique_alternatives
         )
 
-def get_nearby_locations(primary_location: str) -> List[str]:
+# Nearby drop-off points by campus geography (built once; callers only iterate the tuples)
+_LOCATION_CLUSTERS: Dict[str, Tuple[str, ...]] = {
+    "Richard J Daley Library": ("Student Center East", "University Hall"),
+    "Student Center East": ("Richard J Daley Library", "Student Center West"),
+    "Student Center West": ("Student Center East", "Student Services Building"),
+    "Student Services Building": ("Student Center West", "University Hall"),
+    "University Hall": ("Richard J Daley Library", "Student Services Building")
+}
+
+def get_nearby_locations(primary_location: str) -> Tuple[str, ...]:
     """Get nearby/alternative locations based on campus geography"""
-    
-    location_clusters = {
-        "Richard J Daley Library": ["Student Center East", "University Hall"],
-        "Student Center East": ["Richard J Daley Library", "Student Center West"], 
-        "Student Center West": ["Student Center East", "Student Services Building"],
-        "Student Services Building": ["Student Center West", "University Hall"],
-        "University Hall": ["Richard J Daley Library", "Student Services Building"]
-    }
-    
-    return location_clusters.get(primary_location, ["Richard J Daley Library"])
+    return _LOCATION_CLUSTERS.get(primary_location, ("Richard J Daley Library",))
 
 def location_aware_fallback_counter_proposal(
     rejected_proposal: Dict, 
@@ -954,13 +1265,14 @@ def location_aware_fallback_counter_proposal(
             "reasoning": "No alternatives available"
         }
     
-    # Get user's stored preferences
-    favorite_cuisines = user_prefs.get('preferences', {}).get('favorite_cuisines', [])
+    # Get user's stored preferences (cuisines lowercased once, not per alternative)
+    favorite_cuisines = [fav.lower() for fav in user_prefs.get('preferences', {}).get('favorite_cuisines', [])]
     usual_locations = user_prefs.get('preferences', {}).get('usual_locations', [])
     
     # Find best alternative that matches BOTH cuisine and location preferences
     best_alternative = None
     best_score = 0
+    best_restaurant = ''
     
     for alt in alternatives:
         score = 0
@@ -968,10 +1280,8 @@ def location_aware_fallback_counter_proposal(
         alt_location = alt.get('location', '')
         
         # Restaurant preference match (50%)
-        for fav_cuisine in favorite_cuisines:
-            if fav_cuisine.lower() in alt_restaurant or alt_restaurant in fav_cuisine.lower():
-                score += 0.5
-                break
+        if any(fav in alt_restaurant or alt_restaurant in fav for fav in favorite_cuisines):
+            score += 0.5
         
         # Location preference match (30%)
         if alt_location in usual_locations:
@@ -983,14 +1293,12 @@ def location_aware_fallback_counter_proposal(
         if score > best_score:
             best_score = score
             best_alternative = alt
+            best_restaurant = alt_restaurant
     
     # Only counter-propose if score is good (>0.4)
     if best_alternative and best_score > 0.4:
         location_match = best_alternative.get('location') in usual_locations
-        cuisine_match = any(
-            fav.lower() in best_alternative.get('restaurant', '').lower() 
-            for fav in favorite_cuisines
-        )
+        cuisine_match = any(fav in best_restaurant for fav in favorite_cuisines)
         
         preference_explanation = []
         if cuisine_match:
@@ -1021,16 +1329,19 @@ def location_aware_fallback_counter_proposal(
         "reasoning": f"Available alternatives don't match stored preferences well enough (best score: {best_score:.2f})"
     }
 
+NO_ALTERNATIVE_MESSAGE = "No worries! 👍 Maybe next time. I'll keep an eye out for other opportunities for you."
+
 def handle_group_response_no_node(state: PangeaState) -> PangeaState:
     """Handle NO response with intelligent follow-up and location-aware counter-proposals"""
     
     user_phone = state['user_phone']
     
     try:
-        # Find the pending negotiation for this user
+        # Find the pending negotiation for this user (only the fields we use - skips ai_reasoning etc.)
         pending_negotiations = db.collection('negotiations')\
                                .where('to_user', '==', user_phone)\
                                .where('status', '==', 'pending')\
+                               .select(['from_user', 'negotiation_id', 'proposal'])\
                                .limit(1).get()
         
         if len(pending_negotiations) > 0:
@@ -1041,47 +1352,62 @@ def handle_group_response_no_node(state: PangeaState) -> PangeaState:
             # Update negotiation status to rejected
             negotiation_doc.reference.update({'status': 'rejected'})
             
-            # LEARN from rejection
-            learn_from_rejection(user_phone, rejected_proposal)
-            
-            # FIXED: Call get_user_preferences directly (not .invoke())
-            user_prefs = get_user_preferences(user_phone)
+            # Acknowledge right away - the counter-proposal below is a Claude round trip
+            # plus nine Firestore searches, and the user shouldn't wait on it for a reply.
+            # Neutral on purpose: the follow-up is either an alternative or the "next time" text
+            send_friendly_message(user_phone, "Got it 👍 Give me a sec to check for alternatives…", message_type="general")
             
-            # ENHANCED: Use location-aware generate_counter_proposal (finds alternatives AND decides)
-            counter_result = generate_counter_proposal(
-                rejected_proposal=rejected_proposal,
-                declining_user_preferences=user_prefs,
-                user_phone=user_phone
-            )
-            
-            # Check if we found alternatives and should counter-propose
-            alternatives = counter_result.get('alternatives_found', [])
-            
-            if counter_result.get('should_counter', False) and counter_result.get('counter_proposal'):
-                # Send intelligent alternative suggestion using counter_proposal data
-                counter_prop = counter_result['counter_proposal']
+            def counter_then_send():
+                # LEARN from rejection while the preferences read and counter-proposal run -
+                # they don't depend on it, so its Claude + Firestore latency is off the critical path
+                learning_future = _EXEC.submit(learn_from_rejection, user_phone, rejected_proposal)
+                
+                # Already on a worker thread - read the preferences directly
+                user_prefs = load_user_preferences(user_phone)
                 
-                # Enhanced message with location context
-                location_context = ""
-                if counter_prop.get('preference_match'):
-                    location_context = f" {counter_prop.get('preference_match')}!"
+                # ENHANCED: Use location-aware generate_counter_proposal (finds alternatives AND decides)
+                counter_result = generate_counter_proposal(
+                    rejected_proposal=rejected_proposal,
+                    declining_user_preferences=user_prefs,
+                    user_phone=user_phone
+                )
+                
+                if learning_future.exception():
+                    print(f"⚠️ Could not learn from rejection: {learning_future.exception()}")
                 
-                alt_message = f"""No worries about {rejected_proposal.get('restaurant', 'that')}! 
+                if counter_result.get('should_counter', False) and counter_result.get('counter_proposal'):
+                    # Send intelligent alternative suggestion using counter_proposal data
+                    counter_prop = counter_result['counter_proposal']
+                    
+                    # Enhanced message with location context
+                    location_context = ""
+                    if counter_prop.get('preference_match'):
+                        location_context = f" {counter_prop.get('preference_match')}!"
+                    
+                    # Claude drafts the SMS in the same call that made the decision; the template
+                    # covers the heuristic fallback (and a model that left the field out)
+                    alt_message = counter_result.get('user_message') or f"""No worries about {rejected_proposal.get('restaurant', 'that')}! 
 
 How about {counter_prop.get('restaurant')} at {counter_prop.get('location')} instead? {counter_prop.get('why_better', 'It might be a better fit!')}{location_context}
 
 I found someone wanting {counter_prop.get('restaurant')} at {counter_prop.get('location')} around {counter_prop.get('time')}. 
 
 Want me to see if they'd like you to join? 😊 (Just reply YES if interested)"""
-                
-                send_friendly_message(user_phone, alt_message, message_type="location_aware_counter_proposal")
-                
-                # Store the alternative suggestion for potential follow-up
-                state['alternative_suggestions'] = alternatives
-                
-            else:
-                # Standard acknowledgment
-                send_friendly_message(user_phone, "No worries! 👍 Maybe next time. I'll keep an eye out for other opportunities for you.", message_type="general")
+                    
+                    send_friendly_message(user_phone, alt_message, message_type="location_aware_counter_proposal")
+                else:
+                    # Standard acknowledgment
+                    send_friendly_message(user_phone, NO_ALTERNATIVE_MESSAGE, message_type="general")
+            
+            def counter_then_send_or_close():
+                try:
+                    counter_then_send()
+                except Exception as e:
+                    print(f"❌ Counter-proposal follow-up failed: {e}")
+                    # The user was told we're checking - don't leave them hanging
+                    send_friendly_message(user_phone, NO_ALTERNATIVE_MESSAGE, message_type="general")
+            
+            _FOLLOWUP_EXECUTOR.submit(counter_then_send_or_close)
             
             # Notify the original requesting user with enhanced feedback
             requesting_user = negotiation_data['from_user']
@@ -1192,6 +1518,12 @@ Let me know if you need any help!"""
     state['messages'].append(AIMessage(content="Location-aware group response NO processed"))
     return state
 
+# Fields read by the proactive compatibility checks and notification message
+USER_COMPATIBILITY_FIELDS = [
+    'phone', 'preferences', 'successful_matches', 'satisfaction_total', 'satisfaction_count',
+    'satisfaction_scores', 'successful_patterns', 'interactions'
+]
+
 def notify_compatible_users_of_active_groups(
     active_group_data: Dict,
     max_notifications: int = 3,
@@ -1221,16 +1553,43 @@ def notify_compatible_users_of_active_groups(
         print(f"🔔 Finding compatible users for {restaurant} at {location} ({time})")
         print(f"🔔 Current group has {len(current_members)} members")
         
-        # Get all users to check compatibility
+        # Everyone in a pending negotiation, fetched once up front rather than once per user
+        try:
+            pending_negotiations = db.collection('negotiations')\
+                                     .where('status', '==', 'pending')\
+                                     .select(['from_user', 'to_user'])\
+                                     .get()
+            users_in_negotiations = set()
+            for neg in pending_negotiations:
+                neg_data = neg.to_dict()
+                users_in_negotiations.update((neg_data.get('from_user'), neg_data.get('to_user')))
+        except Exception as e:
+            print(f"⚠️ Error checking active negotiations: {e}")
+            users_in_negotiations = set()
+        
+        # Users who list this exact restaurant are the likeliest to clear the threshold,
+        # so Firestore finds them first via array_contains (automatic single-field index).
+        # Substring and history matches still need the full scan, which only starts if
+        # the prefiltered users don't use up max_notifications - both streams are lazy.
         users_ref = db.collection('users')
-        all_users = users_ref.get()
+        exact_fans = users_ref.where('preferences.favorite_cuisines', 'array_contains', restaurant)\
+                              .select(USER_COMPATIBILITY_FIELDS)\
+                              .limit(50)\
+                              .stream()
+        all_users = users_ref.select(USER_COMPATIBILITY_FIELDS).stream()
+        checked_users = set()  # Fans come back again in the full scan
         
         compatible_users = []
         notifications_sent = 0
+        notification_history = None  # Last 24h for everyone, loaded once on the first candidate
         
-        for user_doc in all_users:
+        for user_doc in chain(exact_fans, all_users):
             if notifications_sent >= max_notifications:
                 break
+            
+            if user_doc.id in checked_users:
+                continue
+            checked_users.add(user_doc.id)
                 
             user_data = user_doc.to_dict()
             user_phone = user_data.get('phone', user_doc.id)
@@ -1240,47 +1599,38 @@ def notify_compatible_users_of_active_groups(
                 continue
             
             # Skip if user is already in active negotiations
-            try:
-                active_negotiations = db.collection('negotiations')\
-                                      .where('status', '==', 'pending')\
-                                      .get()
-                
-                user_in_negotiations = False
-                for neg in active_negotiations:
-                    neg_data = neg.to_dict()
-                    if (neg_data.get('from_user') == user_phone or 
-                        neg_data.get('to_user') == user_phone):
-                        user_in_negotiations = True
-                        break
-                
-                if user_in_negotiations:
-                    print(f"🔔 Skipping {user_phone}: already in active negotiations")
-                    continue
-                    
-            except Exception as e:
-                print(f"⚠️ Error checking negotiations for {user_phone}: {e}")
+            if user_phone in users_in_negotiations:
+                print(f"🔔 Skipping {user_phone}: already in active negotiations")
+                continue
             
-            # Check if user should be notified
-            should_notify = check_user_compatibility_for_notification(
-                user_phone, user_data, active_group_data, compatibility_threshold
-            )
+            # Cheap in-memory scoring first; only users who pass go on to the history checks
+            should_notify = score_user_for_notification(user_data, active_group_data, compatibility_threshold)
+            if not should_notify:
+                continue
             
-            if should_notify:
-                # Send notification
-                notification_sent = send_proactive_group_notification(
-                    user_phone, user_data, active_group_data
-                )
-                
-                if notification_sent:
-                    compatible_users.append({
-                        'user_phone': user_phone,
-                        'notification_sent': True,
-                        'compatibility_reason': should_notify.get('reason', 'high_compatibility')
-                    })
-                    notifications_sent += 1
-                    
-                    # Track notification in Firebase
-                    track_proactive_notification(user_phone, active_group_data)
+            # One query for the whole run instead of history lookups per user
+            if notification_history is None:
+                try:
+                    notification_history = load_recent_notification_history()
+                except Exception as e:
+                    print(f"❌ Error checking notification history: {e}")
+                    break  # Default to not notifying if error
+            
+            user_history = notification_history.get(user_phone, [])
+            if is_notification_fatigued(user_history) or has_declined_similar(user_history, active_group_data):
+                continue
+            
+            # Send notification (queued - delivery failures are logged by the SMS pool)
+            send_proactive_group_notification(user_phone, user_data, active_group_data)
+            compatible_users.append({
+                'user_phone': user_phone,
+                'notification_sent': True,
+                'compatibility_reason': should_notify.get('reason', 'high_compatibility')
+            })
+            notifications_sent += 1
+            
+            # Track notification in Firebase
+            track_proactive_notification(user_phone, active_group_data)
         
         return {
             'notifications_sent': notifications_sent,
@@ -1298,33 +1648,31 @@ def notify_compatible_users_of_active_groups(
             'error': str(e)
         }
 
-def check_user_compatibility_for_notification(user_phone: str, user_data: Dict, active_group_data: Dict, threshold: float) -> Dict:
-    """Check if user should be notified about active group - smart filtering logic"""
+def score_user_for_notification(user_data: Dict, active_group_data: Dict, threshold: float) -> Dict:
+    """The in-memory part of the notification checks (steps 1-3) - no Firestore reads"""
     
-    # 1. Check notification fatigue (max 2 per day)
-    if check_notification_fatigue(user_phone):
-        return False
+    # Derived once and shared by the three checks below
+    preferences = user_data.get('preferences') or {}
     
-    # 2. Check if user recently declined similar opportunities
-    if check_recent_declines(user_phone, active_group_data):
-        return False
+    # Cheapest first: the location and timing checks are membership tests, the score
+    # walks the user's cuisines, history and satisfaction scores
     
-    # 3. Calculate compatibility score
-    compatibility_score = calculate_proactive_compatibility(user_data, active_group_data)
+    # 1. Check location intelligence
+    location_match = check_location_intelligence(user_data, active_group_data, preferences)
     
-    if compatibility_score < threshold:
+    if not location_match:
         return False
     
-    # 4. Check location intelligence
-    location_match = check_location_intelligence(user_data, active_group_data)
+    # 2. Check timing patterns
+    timing_match = check_timing_patterns(user_data, active_group_data, preferences)
     
-    if not location_match:
+    if not timing_match:
         return False
     
-    # 5. Check timing patterns
-    timing_match = check_timing_patterns(user_data, active_group_data)
+    # 3. Calculate compatibility score
+    compatibility_score = calculate_proactive_compatibility(user_data, active_group_data, preferences)
     
-    if not timing_match:
+    if compatibility_score < threshold:
         return False
     
     return {
@@ -1333,59 +1681,64 @@ def check_user_compatibility_for_notification(user_phone: str, user_data: Dict,
         'reason': f'High compatibility ({compatibility_score:.2f}) + location match + timing match'
     }
 
-def check_notification_fatigue(user_phone: str) -> bool:
-    """Check if user has received too many notifications today"""
-    try:
-        today = datetime.now().date()
-        
-        # Count notifications sent today
-        notifications_today = db.collection('notification_history')\
-                               .where('user_phone', '==', user_phone)\
-                               .where('date', '==', today)\
-                               .where('type', '==', 'proactive_group')\
-                               .get()
-        
-        return len(notifications_today) >= 2  # Max 2 per day
-        
-    except Exception as e:
-        print(f"❌ Error checking notification fatigue: {e}")
-        return True  # Default to not notifying if error
+def load_recent_notification_history(user_phone: Optional[str] = None) -> Dict[str, List[Dict]]:
+    """
+    Last 24h of notification_history, bucketed by phone (everyone's unless user_phone is given).
+    
+    One query serves both the fatigue and the decline checks: every notification sent
+    today is also inside the 24h window, so the two are partitioned client-side.
+    """
+    yesterday = datetime.now() - timedelta(hours=24)
+    query = db.collection('notification_history')
+    if user_phone is not None:
+        query = query.where('user_phone', '==', user_phone)
+    
+    history = {}
+    for record in query.where('timestamp', '>=', yesterday)\
+                       .select(['user_phone', 'type', 'date', 'response', 'restaurant', 'location'])\
+                       .get():
+        record_data = record.to_dict()
+        history.setdefault(record_data.get('user_phone'), []).append(record_data)
+    return history
+
+def is_notification_fatigued(history: List[Dict]) -> bool:
+    """Too many proactive notifications today, given the user's recent history"""
+    today = datetime.now().date().isoformat()  # Stored as an ISO string by track_proactive_notification
+    sent_today = sum(
+        1 for record in history
+        if record.get('type') == 'proactive_group' and record.get('date') == today
+    )
+    return sent_today >= 2  # Max 2 per day
 
-def check_recent_declines(user_phone: str, active_group_data: Dict) -> bool:
-    """Check if user recently declined similar opportunities"""
-    try:
-        # Check last 24 hours for declines
-        yesterday = datetime.now() - timedelta(hours=24)
-        
-        recent_declines = db.collection('notification_history')\
-                           .where('user_phone', '==', user_phone)\
-                           .where('timestamp', '>=', yesterday)\
-                           .where('response', '==', 'declined')\
-                           .get()
-        
-        restaurant = active_group_data.get('restaurant', '')
-        location = active_group_data.get('location', '')
-        
-        # Check if declined similar restaurant/location combo
-        for decline in recent_declines:
-            decline_data = decline.to_dict()
-            if (decline_data.get('restaurant') == restaurant and 
-                decline_data.get('location') == location):
-                return True
-        
-        return False
-        
-    except Exception as e:
-        print(f"❌ Error checking recent declines: {e}")
-        return False
+def has_declined_similar(history: List[Dict], active_group_data: Dict) -> bool:
+    """Declined this same restaurant/location combo, given the user's recent history"""
+    restaurant = active_group_data.get('restaurant', '')
+    location = active_group_data.get('location', '')
+    return any(
+        record.get('response') == 'declined' and
+        record.get('restaurant') == restaurant and
+        record.get('location') == location
+        for record in history
+    )
+
+def average_satisfaction(user_data: Dict) -> Optional[float]:
+    """Mean satisfaction over the running total/count plus any legacy satisfaction_scores list"""
+    # Writers stopped appending to satisfaction_scores when the total/count fields arrived,
+    # so older users carry both and neither alone is their full history
+    legacy_scores = [score for score in user_data.get('satisfaction_scores') or [] if isinstance(score, (int, float))]
+    total = (user_data.get('satisfaction_total') or 0) + sum(legacy_scores)
+    count = (user_data.get('satisfaction_count') or 0) + len(legacy_scores)
+    return total / count if count else None
 
-def calculate_proactive_compatibility(user_data: Dict, active_group_data: Dict) -> float:
+def calculate_proactive_compatibility(user_data: Dict, active_group_data: Dict, preferences: Optional[Dict] = None) -> float:
     """Calculate compatibility score for proactive notifications (higher threshold)"""
     
-    preferences = user_data.get('preferences', {})
+    if preferences is None:
+        preferences = user_data.get('preferences', {})
     successful_matches = user_data.get('successful_matches', [])
     
     restaurant = active_group_data.get('restaurant', '')
+    restaurant_lower = restaurant.lower()
     location = active_group_data.get('location', '')
     
     score = 0.0
@@ -1394,7 +1747,7 @@ def calculate_proactive_compatibility(user_data: Dict, active_group_data: Dict)
     favorite_cuisines = preferences.get('favorite_cuisines', [])
     if restaurant in favorite_cuisines:
         score += 0.4
-    elif any(cuisine.lower() in restaurant.lower() for cuisine in favorite_cuisines):
+    elif any(cuisine.lower() in restaurant_lower for cuisine in favorite_cuisines):
         score += 0.3
     
     # 2. Historical success at this restaurant (30% weight)
@@ -1409,18 +1762,17 @@ def calculate_proactive_compatibility(user_data: Dict, active_group_data: Dict)
         score += 0.2
     
     # 4. Overall success rate (10% weight)
-    satisfaction_scores = user_data.get('satisfaction_scores', [])
-    if satisfaction_scores:
-        avg_satisfaction = sum(satisfaction_scores) / len(satisfaction_scores)
-        if avg_satisfaction >= 8:  # High satisfaction users
-            score += 0.1
+    avg_satisfaction = average_satisfaction(user_data)
+    if avg_satisfaction is not None and avg_satisfaction >= 8:  # High satisfaction users
+        score += 0.1
     
     return min(score, 1.0)
 
-def check_location_intelligence(user_data: Dict, active_group_data: Dict) -> bool:
+def check_location_intelligence(user_data: Dict, active_group_data: Dict, preferences: Optional[Dict] = None) -> bool:
     """Check if user's location patterns match the group location"""
     
-    preferences = user_data.get('preferences', {})
+    if preferences is None:
+        preferences = user_data.get('preferences', {})
     location = active_group_data.get('location', '')
     time = active_group_data.get('time', 'now')
     
@@ -1444,33 +1796,16 @@ def check_location_intelligence(user_data: Dict, active_group_data: Dict) -> boo
     
     return False
 
-def check_timing_patterns(user_data: Dict, active_group_data: Dict) -> bool:
+def check_timing_patterns(user_data: Dict, active_group_data: Dict, preferences: Optional[Dict] = None) -> bool:
     """Check if user's timing patterns match the group timing"""
     
-    preferences = user_data.get('preferences', {})
-    time = active_group_data.get('time', 'now')
-    
-    # 1. Check preferred times
-    preferred_times = preferences.get('preferred_times', [])
-    if time in preferred_times:
-        return True
-    
-    # 2. Check current time against historical patterns
-    current_hour = datetime.now().hour
-    
-    # Look at successful patterns for similar times
-    successful_patterns = user_data.get('successful_patterns', [])
-    for pattern in successful_patterns:
-        pattern_time = pattern.get('time', '')
-        # Simple time matching - could be more sophisticated
-        if ('lunch' in time.lower() and 'lunch' in pattern_time.lower()) or \
-           ('dinner' in time.lower() and 'dinner' in pattern_time.lower()) or \
-           ('now' in time.lower() and 11 <= current_hour <= 14):  # Lunch hours
-            return True
-    
-    return True  # Default to True for flexible timing
+    # Preferred times and lunch/dinner matches against successful_patterns both accepted
+    # the user, and so did the fallback for flexible timing. With every branch returning
+    # True the per-pattern scan decided nothing, so it's skipped - timing doesn't filter
+    # anyone out until a real rejection rule is added here
+    return True
 
-def send_proactive_group_notification(user_phone: str, user_data: Dict, active_group_data: Dict) -> bool:
+def send_proactive_group_notification(user_phone: str, user_data: Dict, active_group_data: Dict):
     """Send personalized notification about active group"""
     
     restaurant = active_group_data.get('restaurant', '')
@@ -1482,36 +1817,58 @@ def send_proactive_group_notification(user_phone: str, user_data: Dict, active_g
     successful_matches = user_data.get('successful_matches', [])
     preferences = user_data.get('preferences', {})
     
-    # Create personalized message
+    # Create personalized message. Each list is walked once and the walk stops at the first
+    # hit - a set built per call would cost the same full pass before its first probe
     personalization = ""
+    restaurant_lower = restaurant.lower()
     if any(match.get('restaurant') == restaurant for match in successful_matches):
         personalization = f"You ordered from there last week around this time. "
-    elif restaurant.lower() in [cuisine.lower() for cuisine in preferences.get('favorite_cuisines', [])]:
+    elif any(cuisine.lower() == restaurant_lower for cuisine in preferences.get('favorite_cuisines', [])):
         personalization = f"I know you love {restaurant}! "
     
     message = f"""Hey! 🍕 There's a {restaurant} group forming at {location} in {time}. 
 {personalization}
 {group_size} people so far - if you join, we'll have {group_size + 1} people total! Reply YES to jump in!"""
     
-    return send_friendly_message(user_phone, message, message_type="proactive_group")
+    send_friendly_message(user_phone, message, message_type="proactive_group")
+
+# How long a proactive invitation stays answerable with a plain YES/NO
+PROACTIVE_RESPONSE_WINDOW = timedelta(minutes=30)
 
 def track_proactive_notification(user_phone: str, active_group_data: Dict):
     """Track proactive notification in Firebase for analytics and spam prevention"""
     
     try:
+        # Everything the YES/NO handlers need is stored on the notification itself,
+        # so answering it costs a single write and no extra reads
+        notification_id = str(uuid.uuid4())
         notification_record = {
+            'notification_id': notification_id,
             'user_phone': user_phone,
             'type': 'proactive_group',
             'restaurant': active_group_data.get('restaurant', ''),
             'location': active_group_data.get('location', ''),
             'time': active_group_data.get('time', ''),
             'group_id': active_group_data.get('group_id', ''),
+            'expected_group_size': len(active_group_data.get('current_members', [])) + 1,
             'timestamp': datetime.now(),
-            'date': datetime.now().date(),
+            'date': datetime.now().date().isoformat(),  # Firestore can't encode a bare date
             'response': 'pending'  # Will be updated when user responds
         }
         
-        db.collection('notification_history').add(notification_record)
+        # The open notification is also copied onto the user doc, so the per-SMS pending
+        # check is one point read instead of a four-predicate range query
+        active_notification = {
+            key: notification_record[key]
+            for key in ('notification_id', 'restaurant', 'location', 'time', 'group_id', 'expected_group_size')
+        }
+        active_notification['expires_at'] = datetime.now(timezone.utc) + PROACTIVE_RESPONSE_WINDOW
+        
+        batch = db.batch()
+        batch.set(db.collection('notification_history').document(notification_id), notification_record)
+        batch.set(db.collection('users').document(user_phone),
+                  {'active_proactive_notification': active_notification}, merge=True)
+        batch.commit()
         
     except Exception as e:
         print(f"❌ Error tracking proactive notification: {e}")
@@ -1519,18 +1876,13 @@ def track_proactive_notification(user_phone: str, active_group_data: Dict):
 def check_pending_proactive_notifications(user_phone: str) -> Dict:
     """Check if user has pending proactive notifications"""
     try:
-        # Check for notifications sent in the last 30 minutes that haven't been responded to
-        recent_cutoff = datetime.now() - timedelta(minutes=30)
-        
-        pending_notifications = db.collection('notification_history')\
-                                .where('user_phone', '==', user_phone)\
-                                .where('type', '==', 'proactive_group')\
-                                .where('timestamp', '>=', recent_cutoff)\
-                                .where('response', '==', 'pending')\
-                                .limit(1).get()
+        # Notifications sent in the last 30 minutes that haven't been responded to are
+        # kept on the user doc by track_proactive_notification
+        user_doc = db.collection('users').document(user_phone).get(field_paths=['active_proactive_notification'])
+        notification = (user_doc.to_dict() or {}).get('active_proactive_notification') if user_doc.exists else None
         
-        if len(pending_notifications) > 0:
-            return pending_notifications[0].to_dict()
+        if notification and notification.get('expires_at') and notification['expires_at'] > datetime.now(timezone.utc):
+            return notification
         
         return None
         
@@ -1538,25 +1890,27 @@ def check_pending_proactive_notifications(user_phone: str) -> Dict:
         print(f"❌ Error checking pending proactive notifications: {e}")
         return None
 
-def update_proactive_notification_response(user_phone: str, response: str):
+def update_proactive_notification_response(user_phone: str, response: str, notification_data: Dict = None):
     """Update proactive notification with user's response"""
     try:
-        recent_cutoff = datetime.now() - timedelta(minutes=30)
-        
-        pending_notifications = db.collection('notification_history')\
-                                .where('user_phone', '==', user_phone)\
-                                .where('type', '==', 'proactive_group')\
-                                .where('timestamp', '>=', recent_cutoff)\
-                                .where('response', '==', 'pending')\
-                                .limit(1).get()
-        
-        if len(pending_notifications) > 0:
-            notification_doc = pending_notifications[0]
-            notification_doc.reference.update({
-                'response': response,
-                'response_timestamp': datetime.now()
-            })
-            print(f"✅ Updated proactive notification response: {response}")
+        # Notifications carry their own id (see track_proactive_notification) - answer them
+        # with a blind write, no lookup
+        notification_id = (notification_data or {}).get('notification_id')
+        if not notification_id:
+            print(f"⚠️ No proactive notification id for {user_phone} - nothing to update")
+            return
+        notification_ref = db.collection('notification_history').document(notification_id)
+        
+        # Record the answer and retire the user's open-notification copy in one commit
+        batch = db.batch()
+        batch.set(notification_ref, {
+            'response': response,
+            'response_timestamp': datetime.now()
+        }, merge=True)
+        batch.set(db.collection('users').document(user_phone),
+                  {'active_proactive_notification': firestore.DELETE_FIELD}, merge=True)
+        batch.commit()
+        print(f"✅ Updated proactive notification response: {response}")
             
     except Exception as e:
         print(f"❌ Error updating proactive notification response: {e}")
@@ -1566,7 +1920,7 @@ def update_proactive_notification_response(user_phone: str, response: str):
 def learn_from_rejection(rejecting_user: str, rejected_proposal: Dict, rejection_reason: str = None):
     """Learn from rejections to improve future matching"""
     
-    update_user_memory(rejecting_user, {
+    run_in_background(update_user_memory, rejecting_user, {
         'interaction_type': 'proposal_rejection',
         'rejected_restaurant': rejected_proposal.get('restaurant'),
         'rejected_time': rejected_proposal.get('time'),
@@ -1577,11 +1931,13 @@ def learn_from_rejection(rejecting_user: str, rejected_proposal: Dict, rejection
     })
 
 
-def send_friendly_message(phone_number: str, message: str, message_type: str = "general") -> bool:
+def send_friendly_message(phone_number: str, message: str, message_type: str = "general") -> None:
     """
     Send contextual, friendly SMS messages using Claude 4's enhanced conversational abilities.
     
     Automatically adapts tone and content based on message type and user history.
+    The message is queued on the background SMS pool and this call returns immediately;
+    messages to the same recipient are still delivered in the order they were queued.
     
     Args:
         phone_number: Recipient's phone number
@@ -1594,16 +1950,38 @@ def send_friendly_message(phone_number: str, message: str, message_type: str = "
             - "reminder": Order follow-up
         
     Returns:
-        True if message sent successfully, False otherwise
+        None - delivery happens later on the SMS pool, which logs any failure
         
     Example:
-        success = send_friendly_message(
+        send_friendly_message(
             "+1234567890", 
             "Found a great group for Thai food!",
             message_type="match_found"
         )
     """
-    print(f"📞 SEND_FRIENDLY_MESSAGE called: to={phone_number}, type={message_type}, message_length={len(message)}")
+    print(f"📞 SEND_FRIENDLY_MESSAGE queued: to={phone_number}, type={message_type}, message_length={len(message)}")
+    
+    try:
+        with _msg_chain_lock:
+            previous = _last_msg_future.get(phone_number)
+            future = _msg_pool.submit(_deliver_friendly_message, phone_number, message, message_type, previous)
+            _last_msg_future[phone_number] = future
+        future.add_done_callback(lambda done, phone=phone_number: _release_msg_chain(phone, done))
+    except Exception as e:
+        print(f"📞 Failed to queue SMS: {e}")
+
+def _release_msg_chain(phone_number: str, future: Future):
+    """Forget the chain tail for a recipient once its last queued message is out"""
+    with _msg_chain_lock:
+        if _last_msg_future.get(phone_number) is future:
+            del _last_msg_future[phone_number]
+
+def _deliver_friendly_message(phone_number: str, message: str, message_type: str, previous: Optional[Future] = None) -> bool:
+    """Enhance and send one SMS (runs on the background SMS pool)"""
+    # Wait for the previous message to this recipient so they arrive in order.
+    # The pool is FIFO, so the previous send is already running or finished.
+    if previous is not None:
+        wait([previous])
     
     try:
         # Enhance message with Claude 4's conversational abilities
@@ -1613,13 +1991,13 @@ def send_friendly_message(phone_number: str, message: str, message_type: str = "
         print(f"📞 About to call Twilio API...")
         message_instance = twilio_client.messages.create(
             body=enhanced_message,
-            from_=os.getenv('TWILIO_PHONE_NUMBER'),
+            from_=TWILIO_FROM,
             to=phone_number
         )
         print(f"📞 Twilio API returned - SID: {message_instance.sid}, Status: {message_instance.status}")
         
         # Log interaction for learning
-        log_interaction(phone_number, {
+        run_in_background(log_interaction, phone_number, {
             'message_sent': enhanced_message,
             'message_type': message_type,
             'timestamp': datetime.now()
@@ -1628,34 +2006,56 @@ def send_friendly_message(phone_number: str, message: str, message_type: str = "
         return True
     except Exception as e:
         print(f"📞 SMS failed with exception: {e}")
-        import traceback
         print(f"📞 Full SMS exception traceback: {traceback.format_exc()}")
         return False
 
+_enhanced_message_cache = _TTLCache(ttl=3600, maxsize=4096)
+
+# Static instructions for the per-SMS rewrite; only the message and its context vary per call.
+# Plain system message: ~55 tokens is far under the 1024-token prompt-caching minimum
+ENHANCE_MESSAGE_SYSTEM_PROMPT = """Enhance the user's message to be more friendly and contextual.
+
+Make it sound like a helpful friend who knows them, but keep it brief and natural.
+Add appropriate emojis and personality. Don't be overly enthusiastic."""
+
+def order_history_bucket(past_orders: int) -> str:
+    """Coarse order-count band for prompts - close counts don't change the tone Claude picks"""
+    if past_orders == 0:
+        return "no"
+    if past_orders < 3:
+        return "1-2"
+    if past_orders < 10:
+        return "3-9"
+    return "10+"
+
 def enhance_message_with_context(message: str, message_type: str, user_history: Dict) -> str:
     """Use Claude 4 to enhance messages with personalization and context"""
     
-    # Get user's name or create friendly identifier
-    user_name = user_history.get('preferences', {}).get('name', 'friend')
-    past_orders = len(user_history.get('successful_matches', []))
-    
-    enhancement_prompt = f"""
-    Enhance this message to be more friendly and contextual:
+    past_orders = order_history_bucket(len(user_history.get('successful_matches', [])))
     
-    Original message: "{message}"
-    Message type: {message_type}
-    User context: {past_orders} previous successful orders
+    # Templated messages repeat across users - the same text, type and history band
+    # render the same prompt, so reuse the earlier rewrite instead of calling Claude
+    cache_key = (message_type, past_orders, hashlib.sha1(message.encode()).hexdigest())
+    cached = _enhanced_message_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    Make it sound like a helpful friend who knows them, but keep it brief and natural.
-    Add appropriate emojis and personality. Don't be overly enthusiastic.
-    """
+    enhancement_prompt = f"""Original message: "{message}"
+Message type: {message_type}
+User context: {past_orders} previous successful orders"""
     
     try:
-        response = anthropic_llm.invoke([HumanMessage(content=enhancement_prompt)])
+        response = anthropic_llm.invoke([
+            SystemMessage(content=ENHANCE_MESSAGE_SYSTEM_PROMPT),
+            HumanMessage(content=enhancement_prompt)
+        ], max_tokens=SMS_MAX_TOKENS)
         enhanced = response.content.strip()
         
         # Fallback to original if enhancement fails
-        return enhanced if len(enhanced) > 0 else message
+        if not enhanced:
+            return message
+        _enhanced_message_cache.set(cache_key, enhanced)
+        return enhanced
     except:
         return message
 
@@ -1688,159 +2088,262 @@ def update_user_memory(phone_number: str, interaction_data: Dict) -> bool:
     """
     try:
         # Enhanced learning with Claude 4's reasoning
-        insights = extract_learning_insights(phone_number, interaction_data)
-        
-        user_ref = db.collection('users').document(phone_number)
-        
-        # Get current data
-        current_doc = user_ref.get()
-        current_data = current_doc.to_dict() if current_doc.exists else {}
-        
-        # Update with new interaction and insights
-        updated_data = {
-            'interactions': firestore.ArrayUnion([{
-                **interaction_data,
-                'timestamp': datetime.now(),
-                'insights': insights
-            }]),
-            'last_updated': datetime.now()
-        }
-        
-        # Update learned preferences
-        if insights.get('preference_updates'):
-            current_prefs = current_data.get('preferences', {})
-            updated_prefs = {**current_prefs, **insights['preference_updates']}
-            updated_data['preferences'] = updated_prefs
-        
-        # Update success patterns
-        if interaction_data.get('satisfaction_score', 0) >= 7:
-            updated_data['successful_patterns'] = firestore.ArrayUnion([{
-                'restaurant': interaction_data.get('restaurant'),
-                'time': interaction_data.get('order_time'),
-                'location': interaction_data.get('location'),
-                'group_size': len(interaction_data.get('group_members', [])),
-                'success_score': interaction_data.get('satisfaction_score')
-            }])
-        
-        user_ref.update(updated_data)
+        updated_data = build_user_memory_update(phone_number, interaction_data)
+        db.collection('users').document(phone_number).update(updated_data)
+        _prefs_cache.pop(phone_number)
         return True
         
     except Exception as e:
         print(f"Memory update failed: {e}")
         return False
 
-def extract_learning_insights(phone_number: str, interaction_data: Dict) -> Dict:
-    """Use Claude 4's reasoning to extract insights from user interactions"""
-    
-    analysis_prompt = f"""
-    Analyze this user interaction to extract learning insights:
+def build_user_memory_update(phone_number: str, interaction_data: Dict) -> Dict:
+    """Extract insights for one interaction and build the Firestore update (no reads needed)"""
+    insights = extract_learning_insights(phone_number, interaction_data)
     
-    User: {phone_number}
-    Interaction: {json.dumps(interaction_data, default=str)}
-    
-    Extract insights about:
-    1. Food preferences (what they liked/disliked)
-    2. Timing preferences (when they prefer to eat)
-    3. Social preferences (group size, types of people they work well with)
-    4. Price sensitivity
-    5. Any patterns or preferences to remember for future matching
+    # Update with new interaction and insights
+    updated_data = {
+        'interactions': firestore.ArrayUnion([{
+            **interaction_data,
+            'timestamp': datetime.now(),
+            'insights': insights
+        }]),
+        'last_updated': datetime.now()
+    }
     
-    Return as JSON with keys: preference_updates, timing_insights, social_insights, price_insights
+    # Update learned preferences - nested field paths merge into the existing map
+    if insights.get('preference_updates'):
+        for pref_key, pref_value in insights['preference_updates'].items():
+            updated_data[FieldPath('preferences', pref_key).to_api_repr()] = pref_value
+    
+    # Running satisfaction mean kept as total + count: server-side increments, so there's no
+    # read-modify-write and readers divide instead of averaging a growing list
+    if isinstance(interaction_data.get('satisfaction_score'), (int, float)):
+        updated_data['satisfaction_total'] = firestore.Increment(interaction_data['satisfaction_score'])
+        updated_data['satisfaction_count'] = firestore.Increment(1)
+    
+    # Update success patterns
+    if interaction_data.get('satisfaction_score', 0) >= 7:
+        updated_data['successful_patterns'] = firestore.ArrayUnion([{
+            'restaurant': interaction_data.get('restaurant'),
+            'time': interaction_data.get('order_time'),
+            'location': interaction_data.get('location'),
+            'group_size': len(interaction_data.get('group_members', [])),
+            'success_score': interaction_data.get('satisfaction_score')
+        }])
+    
+    return updated_data
+
+def batch_update_user_memory(members: List[str], interaction_data: Dict,
+                             member_updates: Optional[Dict[str, Dict]] = None) -> bool:
+    """Same learning as update_user_memory for a whole group, committed as one Firestore batch.
+    
+    member_updates holds extra per-member fields to write in the same batch.
     """
-    
     try:
-        response = anthropic_llm.invoke([HumanMessage(content=analysis_prompt)])
-        insights = json.loads(response.content)
-        return insights
-    except:
+        # Insight extraction is a Claude call per member - run those side by side
+        updates = list(_EXEC.map(
+            lambda member: build_user_memory_update(member, interaction_data), members
+        ))
+        
+        for member, updated_data in zip(members, updates):
+            updated_data.update((member_updates or {}).get(member, {}))
+        
+        batch = db.batch()
+        for member, updated_data in zip(members, updates):
+            batch.update(db.collection('users').document(member), updated_data)
+        
+        try:
+            batch.commit()
+        except Exception as e:
+            # A missing user doc fails the whole batch - fall back to per-member writes
+            print(f"⚠️ Batched memory update failed ({e}), writing members individually")
+            for member, updated_data in zip(members, updates):
+                try:
+                    db.collection('users').document(member).update(updated_data)
+                except Exception as member_error:
+                    print(f"Memory update failed for {member}: {member_error}")
+        finally:
+            for member in members:
+                _prefs_cache.pop(member)
+        return True
+        
+    except Exception as e:
+        print(f"Batched memory update failed: {e}")
+        return False
+
+# Static instructions for memory updates; the user and interaction follow in the human turn.
+# Plain system message: ~110 tokens is far under the 1024-token prompt-caching minimum
+LEARNING_INSIGHTS_SYSTEM_PROMPT = """Analyze the user interaction to extract learning insights.
+
+Extract insights about:
+1. Food preferences (what they liked/disliked)
+2. Timing preferences (when they prefer to eat)
+3. Social preferences (group size, types of people they work well with)
+4. Price sensitivity
+5. Any patterns or preferences to remember for future matching
+
+Return as JSON with keys: preference_updates, timing_insights, social_insights, price_insights"""
+
+def extract_learning_insights(phone_number: str, interaction_data: Dict) -> Dict:
+    """Use Claude 4's reasoning to extract insights from user interactions"""
+    
+    analysis_prompt = f"""User: {phone_number}
+Interaction: {format_prompt_fields(interaction_data)}"""
+    
+    try:
+        response = anthropic_llm.invoke([
+            SystemMessage(content=LEARNING_INSIGHTS_SYSTEM_PROMPT),
+            HumanMessage(content=analysis_prompt)
+        ])
+        insights = json_loads(response.content)
+        return insights
+    except:
         return {"insights_extraction": "failed"}
 
 # ===== ROUTING PATTERN =====
+def classify_yes_no_reply(message: str) -> Optional[str]:
+    """Return 'yes', 'no' or None for a reply to an invitation"""
+    message_lower = message.lower().strip()
+    
+    # Fast path: exact short answers ("yep", "sounds good", "nah", "👍")
+    if _YES_RE.fullmatch(message_lower):
+        return 'yes'
+    if _NO_RE.fullmatch(message_lower):
+        return 'no'
+    
+    # Longer replies keep the original keyword heuristics
+    if 'yes' in message_lower or 'y' == message_lower or 'sure' in message_lower or 'ok' in message_lower:
+        return 'yes'
+    if 'no' in message_lower or 'n' == message_lower or 'pass' in message_lower or 'nah' in message_lower:
+        return 'no'
+    return None
+
+# Routing rules for the per-SMS intent classifier; identical on every call so Anthropic's
+# prompt cache serves them and only the user's message is billed at the full rate
+INTENT_CLASSIFIER_SYSTEM_PROMPT = """Classify this message intent for a food delivery matching service.
+
+Options:
+- spontaneous_order: User wants food now/soon
+  e.g. "chipotle at the library around 12:30", "anyone want thai food rn", "hungry, pizza near SCE?"
+- morning_response: Response to "where will you be today" question
+  e.g. "I'll be at Daley Library most of the day", "on campus until 3", "student center this afternoon"
+- preference_update: User updating their food preferences
+  e.g. "I'm vegetarian now", "stop suggesting burgers", "I usually eat lunch around 1"
+- group_response: Response to a group invitation
+  e.g. "I'm down for that group", "can't make that one", "which group is that?"
+- general_question: Non-food related questions, greetings, help requests
+  e.g. "how does this work?", "how much is delivery?", "hi", "what restaurants are there?"
+
+Return only the classification."""
+
+# Positive phrasings routed without Claude, anchored at the start of the message so a
+# keyword buried in "I'm not hungry" or "chipotle was terrible" can't trip them. Anything
+# carrying a negation or complaint, or matching rules for more than one label, goes to Claude.
+_INTENT_VETO_RE = re.compile(
+    r"\b(not|no|never|nah|nope|can'?t|cannot|don'?t|won'?t|isn'?t|wasn'?t|hate|terrible|awful|gross|worst)\b|n't\b",
+    re.I
+)
+_INTENT_RULES: Tuple[Tuple[re.Pattern, str], ...] = (
+    (re.compile(r"(i'?m (now )?(vegetarian|vegan)|i'?m allergic to|i am allergic to|stop suggesting|"
+                r"i usually eat|my favou?rite (food|restaurant|cuisine) is)\b", re.I), 'preference_update'),
+    (re.compile(r"((i'?m )?(so )?(hungry|starving)|(i'?m )?craving|anyone want|anyone down for|"
+                r"i want to (order|grab|get) (some )?(food|lunch|dinner))\b", re.I), 'spontaneous_order'),
+    (re.compile(r"(i'?ll be|i will be) (at|in) |(on campus (until|till|all day))\b", re.I), 'morning_response'),
+    (re.compile(r"(which group|i'?m down for (that|the) group)\b", re.I), 'group_response'),
+    (re.compile(r"((hi|hello|hey|help)[!.?\s]*$|how does (this|it|pangea) work|what is pangea|who is this)", re.I),
+     'general_question'),
+)
+
+def fast_classify_intent(message: str) -> Optional[str]:
+    """Intent label from _INTENT_RULES, or None when Claude should decide"""
+    message = message.strip()
+    if _INTENT_VETO_RE.search(message):
+        return None
+    labels = {label for pattern, label in _INTENT_RULES if pattern.match(message)}
+    return labels.pop() if len(labels) == 1 else None
+
 def classify_message_intent_node(state: PangeaState) -> PangeaState:
     """Anthropic's Routing pattern - classify input and direct to specialized task"""
     
     last_message = state['messages'][-1].content
     user_phone = state['user_phone']
     
+    # Only a yes/no reply can answer an invitation, so other messages skip those lookups
+    reply = classify_yes_no_reply(last_message)
+    
+    # Every lookup below is an independent Firestore round trip - start them all at once
+    # and read the results in priority order, so an SMS waits for the slowest one, not the sum
+    session_future = _EXEC.submit(db.collection('order_sessions').document(user_phone).get)
+    # Through the prefs cache: the same read serves send_friendly_message and the
+    # downstream nodes for this message, and repeat texts within 60s skip Firestore entirely
+    user_future = _EXEC.submit(load_user_preferences, user_phone)
+    invitation_futures = []
+    proactive_future = None
+    if reply:
+        invitation_futures = [
+            # Old negotiation-based invitations
+            _EXEC.submit(db.collection('negotiations')
+                           .where('to_user', '==', user_phone)
+                           .where('status', '==', 'pending')
+                           .limit(1).get),
+            # New perfect match group invitations, ALSO 'forming' groups in case of race
+            # condition - one 'in' query instead of one per status
+            _EXEC.submit(db.collection('active_groups')
+                           .where('members', 'array_contains', user_phone)
+                           .where('status', 'in', ['pending_responses', 'forming'])
+                           .limit(1).get),
+        ]
+        proactive_future = _EXEC.submit(check_pending_proactive_notifications, user_phone)
+    
+    def skip_remaining_lookups():
+        for future in invitation_futures + [user_future, proactive_future]:
+            if future is not None:
+                future.cancel()
+    
     # FIRST: Check if user has active order session - this takes priority
     try:
-        session = db.collection('order_sessions').document(user_phone).get()
+        session = session_future.result()
         if session.exists:
             # User has active order session, send to order processor
             state['conversation_stage'] = "order_continuation"
+            skip_remaining_lookups()
             return state
     except Exception as e:
         print(f"Error checking order session: {e}")
     
     # Check if first-time user
-    user_doc = db.collection('users').document(user_phone).get()
-    if not user_doc.exists:
+    if user_future.result().get('new_user'):
         state['conversation_stage'] = "welcome_new_user"
+        skip_remaining_lookups()
         return state
     
     # SECOND: Check if this is a response to a group invitation
     try:
-        # Check for old negotiation-based invitations
-        pending_negotiations = db.collection('negotiations')\
-                               .where('to_user', '==', user_phone)\
-                               .where('status', '==', 'pending')\
-                               .limit(1).get()
-        
-        # Check for new perfect match group invitations  
-        pending_groups = db.collection('active_groups')\
-                          .where('members', 'array_contains', user_phone)\
-                          .where('status', '==', 'pending_responses')\
-                          .limit(1).get()
-        
-        # ALSO check for 'forming' status groups in case of race condition
-        forming_groups = db.collection('active_groups')\
-                          .where('members', 'array_contains', user_phone)\
-                          .where('status', '==', 'forming')\
-                          .limit(1).get()
-        
-        if len(pending_negotiations) > 0 or len(pending_groups) > 0 or len(forming_groups) > 0:
+        if any(len(future.result()) > 0 for future in invitation_futures):
             # This user has a pending group invitation (either type)
-            message_lower = last_message.lower().strip()
-            if 'yes' in message_lower or 'y' == message_lower or 'sure' in message_lower or 'ok' in message_lower:
-                state['conversation_stage'] = "group_response_yes"
-                return state
-            elif 'no' in message_lower or 'n' == message_lower or 'pass' in message_lower or 'nah' in message_lower:
-                state['conversation_stage'] = "group_response_no"
-                return state
+            state['conversation_stage'] = "group_response_yes" if reply == 'yes' else "group_response_no"
+            skip_remaining_lookups()
+            return state
     except Exception as e:
         print(f"Error checking pending invitations: {e}")
     
     # THIRD: Check if this is a response to proactive group notifications
-    proactive_notification = check_pending_proactive_notifications(user_phone)
+    proactive_notification = proactive_future.result() if proactive_future else None
     if proactive_notification:
-        message_lower = last_message.lower().strip()
-        if 'yes' in message_lower or 'y' == message_lower or 'sure' in message_lower or 'ok' in message_lower:
-            state['conversation_stage'] = "proactive_group_yes"
-            state['proactive_notification_data'] = proactive_notification
-            return state
-        elif 'no' in message_lower or 'n' == message_lower or 'pass' in message_lower or 'nah' in message_lower:
-            state['conversation_stage'] = "proactive_group_no"
-            state['proactive_notification_data'] = proactive_notification
-            return state
-    
-    # If not a group response, use LLM to classify intent
-    classification_prompt = f"""
-    Classify this message intent for a food delivery matching service:
-    
-    Message: "{last_message}"
-    
-    Options:
-    - spontaneous_order: User wants food now/soon
-    - morning_response: Response to "where will you be today" question  
-    - preference_update: User updating their food preferences
-    - group_response: Response to a group invitation
-    - general_question: Non-food related questions, greetings, help requests
-    
-    Return only the classification.
-    """
+        state['conversation_stage'] = "proactive_group_yes" if reply == 'yes' else "proactive_group_no"
+        state['proactive_notification_data'] = proactive_notification
+        return state
     
-    response = anthropic_llm.invoke([HumanMessage(content=classification_prompt)])
-    intent = response.content.strip().lower()
+    # If not a group response, obvious phrasings are routed by regex; Claude classifies the
+    # rest (static rules are a cached system block)
+    intent = fast_classify_intent(last_message)
+    if intent is None:
+        response = anthropic_llm.invoke([
+            cached_system_message(INTENT_CLASSIFIER_SYSTEM_PROMPT),
+            HumanMessage(content=f"Message: \"{last_message}\"")
+        ], max_tokens=LABEL_MAX_TOKENS)
+        intent = response.content.strip().lower()
     
     # If it's a general question OR no clear intent is found, try FAQ fallback
     if intent == 'general_question' or intent not in ['spontaneous_order', 'morning_response', 'preference_update', 'group_response', 'general_question']:
@@ -1887,7 +2390,7 @@ def process_morning_response_node(state: PangeaState) -> PangeaState:
     
     response = anthropic_llm.invoke([HumanMessage(content=extraction_prompt)])
     try:
-        preferences = json.loads(response.content)
+        preferences = json_loads(response.content)
     except:
         preferences = {"location": "Student Union", "food_preferences": ["any"], "time_preference": "lunch"}
     
@@ -1937,35 +2440,32 @@ Let me reach out to their AI friends and see if we can form a group. I'll get ba
     state['messages'].append(AIMessage(content=message))
     return state
 
-def analyze_spontaneous_request_node(state: PangeaState) -> PangeaState:
-   """Agent analyzes spontaneous food request with better extraction"""
-   
-   user_message = state['messages'][-1].content
-   user_phone = state['user_phone']
-   print(f"🔍 User said: '{user_message}'")
-   
-   # 🧹 CLEAN SLATE: Remove ALL old data for this user when they make a new request
-   cleanup_all_user_data(user_phone)
-   
-   # Extract request data using Claude
-   analysis_prompt = f"""
-You are a smart location-matching agent. Extract information from this food request:
+# Alias tables compiled into one alternation each (longest first, so "student center east"
+# wins over shorter overlaps) for the no-Claude path of analyze_spontaneous_request_node
+def _alias_pattern(aliases: Dict[str, str]) -> re.Pattern:
+    return re.compile(
+        r"\b(" + "|".join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True)) + r")\b", re.I
+    )
 
-User message: "{user_message}"
+_RESTAURANT_ALIAS_RE = _alias_pattern(RESTAURANT_NAME_ALIASES)
+_DROPOFF_ALIAS_RE = _alias_pattern(DROPOFF_NAME_ALIASES)
+# Time phrases kept verbatim: "around 12:30", "1pm", "by 2", "rn", "in 20 mins"
+_REQUEST_TIME_RE = re.compile(
+    r"\b(?:(?:around|about|at|by|before|after)\s+)?\d{1,2}(?::\d{2}\s*(?:am|pm)?|\s*(?:am|pm))\b"
+    r"|\b(?:around|about|by|before|after)\s+\d{1,2}\b"
+    r"|\b(?:right now|now|rn|asap|in \d+\s*(?:min(?:ute)?s?|hours?))\b",
+    re.I
+)
+
+# Extraction rules for the Claude path, built once so every call sends an identical prefix. At ~320
+# tokens it is under the 1024-token caching minimum; cache_control takes effect once the lists grow
+SPONTANEOUS_REQUEST_SYSTEM_PROMPT = f"""You are a smart location-matching agent. Extract information from the user's food request.
 
 AVAILABLE LOCATIONS (you MUST pick exactly one):
-- Richard J Daley Library
-- Student Center East
-- Student Center West
-- Student Services Building
-- University Hall
+{DROPOFFS_BULLET_LIST}
 
 AVAILABLE RESTAURANTS (pick the BEST match):
-- Chipotle
-- McDonald's
-- Chick-fil-A
-- Portillo's
-- Starbucks
+{RESTAURANTS_BULLET_LIST}
 
 RESTAURANT MATCHING RULES:
 - "McDonald's" or "McDonalds" → "McDonald's"
@@ -1986,16 +2486,50 @@ LOCATION MATCHING RULES:
 IMPORTANT: For time, preserve the EXACT user intent. Don't convert to generic terms.
 
 Return ONLY this JSON format:
-{{"restaurant": "exact match from list", "location": "exact match from list", "time_preference": "PRESERVE EXACT USER TIME"}}
-"""
+{{"restaurant": "exact match from list", "location": "exact match from list", "time_preference": "PRESERVE EXACT USER TIME"}}"""
+
+def match_spontaneous_request(user_message: str) -> Optional[Dict]:
+    """Restaurant/location/time straight from the alias tables, or None if Claude should decide"""
+    restaurants = {RESTAURANT_NAME_ALIASES[hit.lower()] for hit in _RESTAURANT_ALIAS_RE.findall(user_message)}
+    locations = {DROPOFF_NAME_ALIASES[hit.lower()] for hit in _DROPOFF_ALIAS_RE.findall(user_message)}
+    times = [hit.group(0) for hit in _REQUEST_TIME_RE.finditer(user_message)]
+    
+    # Only the unambiguous case: exactly one of each, all spelled out
+    if len(restaurants) != 1 or len(locations) != 1 or len(times) != 1:
+        return None
+    return {
+        "restaurant": restaurants.pop(),
+        "location": locations.pop(),
+        "time_preference": times[0].strip()
+    }
+
+def analyze_spontaneous_request_node(state: PangeaState) -> PangeaState:
+   """Agent analyzes spontaneous food request with better extraction"""
    
-   response = anthropic_llm.invoke([HumanMessage(content=analysis_prompt)])
-   try:
-       request_data = json.loads(response.content.strip())
-       print(f"✅ Agent extracted: {request_data}")
-   except Exception as e:
-       print(f"❌ Agent extraction failed: {e}")
-       request_data = {"restaurant": "any", "location": "Richard J Daley Library", "time_preference": "now"}
+   user_message = state['messages'][-1].content
+   user_phone = state['user_phone']
+   print(f"🔍 User said: '{user_message}'")
+   
+   # 🧹 CLEAN SLATE: Remove ALL old data for this user when they make a new request
+   cleanup_all_user_data(user_phone)
+   
+   # Requests that name one restaurant, one drop-off and one time need no Claude call
+   request_data = match_spontaneous_request(user_message)
+   if request_data is not None:
+       print(f"✅ Matched from alias tables: {request_data}")
+   
+   # Otherwise extract request data using Claude (matching rules are a cached system block)
+   if request_data is None:
+       response = anthropic_llm.invoke([
+           cached_system_message(SPONTANEOUS_REQUEST_SYSTEM_PROMPT),
+           HumanMessage(content=f"User message: \"{user_message}\"")
+       ])
+       try:
+           request_data = json_loads(response.content.strip())
+           print(f"✅ Agent extracted: {request_data}")
+       except Exception as e:
+           print(f"❌ Agent extraction failed: {e}")
+           request_data = {"restaurant": "any", "location": "Richard J Daley Library", "time_preference": "now"}
    
    state['current_request'] = request_data
    state['conversation_stage'] = 'spontaneous_matching'
@@ -2144,11 +2678,8 @@ def create_group_and_send_invitations(state: PangeaState, match: Dict, group_id:
         for phone in sorted_phones:
             invitation_message = f"🍕 Perfect match found! Someone nearby wants {restaurant} delivered to {delivery_location} at {delivery_time}. Want to split the order and save on delivery? Reply YES to join or NO to pass."
             
-            success = send_friendly_message(phone, invitation_message, message_type="match_found")
-            if success:
-                print(f"📱 Sent invitation SMS to {phone}")
-            else:
-                print(f"❌ Failed to send SMS to {phone}")
+            send_friendly_message(phone, invitation_message, message_type="match_found")
+            print(f"📱 Queued invitation SMS to {phone}")
         
         print(f"🎉 Group {group_id} created and invitations sent to both users")
         
@@ -2177,6 +2708,7 @@ def mark_as_matched_user(state: PangeaState, creator_phone: str, group_id: str):
             'current_match_status': user_status,
             'last_activity': datetime.now()
         })
+        _prefs_cache.pop(state['user_phone'])
         
         print(f"✅ Marked {state['user_phone']} as matched user waiting for invitation from {creator_phone}")
         print(f"👀 Waiting for group {group_id} invitation...")
@@ -2189,9 +2721,8 @@ def mark_as_matched_user(state: PangeaState, creator_phone: str, group_id: str):
 def multi_agent_negotiation_node(state: PangeaState) -> PangeaState:
     """Advanced autonomous negotiation with better perfect match handling"""
     
-    # ADD THIS DEBUG AT THE VERY TOP
     print(f"🔍 ENTERING multi_agent_negotiation_node for user: {state['user_phone']}")
-    print(f"🔍 Current request: {state['current_request']}")
+    logger.debug("Current request: %s", state['current_request'])
     
     request = state['current_request']
     matches = state['potential_matches']
@@ -2202,10 +2733,11 @@ def multi_agent_negotiation_node(state: PangeaState) -> PangeaState:
     # Check for perfect matches - immediately form groups without negotiation
     perfect_matches = [match for match in matches if match.get('compatibility_score', 0) >= 0.8]
     
-    print(f"🔍 DEBUG: Found {len(matches)} total matches")
-    for i, match in enumerate(matches):
-        print(f"   Match {i+1}: score={match.get('compatibility_score', 0)}, user={match.get('user_phone')}")
-    print(f"🔍 DEBUG: {len(perfect_matches)} perfect matches (>= 0.8)")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found %s total matches", len(matches))
+        for i, match in enumerate(matches):
+            logger.debug("   Match %s: score=%s, user=%s", i + 1, match.get('compatibility_score', 0), match.get('user_phone'))
+        logger.debug("%s perfect matches (>= 0.8)", len(perfect_matches))
     
     if perfect_matches:
         # Perfect match found! Use single-writer pattern to prevent race conditions
@@ -2234,29 +2766,35 @@ def multi_agent_negotiation_node(state: PangeaState) -> PangeaState:
         # Removed complex transaction code - single-writer pattern is much simpler!
     
     # No perfect matches - proceed with negotiations for imperfect matches
+    # The requester's side of the proposal is the same for every match, so build it once
+    primary_proposal = {
+        'restaurant': request.get('restaurant'),
+        'time': request.get('time_preference'),
+        'location': request.get('location')
+    }
+    base_proposal = {
+        'restaurant': primary_proposal['restaurant'],
+        'primary_restaurant': primary_proposal['restaurant'],
+        'location': primary_proposal['location'],
+        'time': primary_proposal['time'],
+        'requesting_user': state['user_phone'],
+        'group_size_current': 2,
+        'max_group_size': MAX_GROUP_SIZE
+    }
+    
     for match in matches:
         negotiation_id = str(uuid.uuid4())
         
         # Enhanced proposal structure
         enhanced_proposal = {
-            'restaurant': request.get('restaurant'),
-            'primary_restaurant': request.get('restaurant'),
-            'location': request.get('location'),
-            'time': request.get('time_preference'),
-            'requesting_user': state['user_phone'],
+            **base_proposal,
             'alternatives': [],
             'incentives': ["Group discount", "Faster delivery"],
-            'group_size_current': 2,
-            'max_group_size': MAX_GROUP_SIZE,
             'compatibility_score': match.get('compatibility_score', 0.5),
-            'primary_proposal': {
-                'restaurant': request.get('restaurant'),
-                'time': request.get('time_preference'),
-                'location': request.get('location')
-            }
+            'primary_proposal': dict(primary_proposal)
         }
         
-        print(f"🔍 DEBUG - Created proposal with restaurant: '{enhanced_proposal.get('restaurant')}'")
+        logger.debug("Created proposal with restaurant: '%s'", enhanced_proposal.get('restaurant'))
         
         # FIXED: Call negotiate_with_other_ai directly (not .invoke())
         result = negotiate_with_other_ai(
@@ -2265,6 +2803,8 @@ def multi_agent_negotiation_node(state: PangeaState) -> PangeaState:
             negotiation_id=negotiation_id,
             strategy="collaborative"
         )
+        if result.get('status') == 'throttled':
+            continue
         
         negotiations.append({
             'negotiation_id': negotiation_id,
@@ -2295,6 +2835,64 @@ I'm working with their AI friends to confirm the group order details. Give me ab
     
     return state
 
+class GroupFullError(Exception):
+    """Raised when accepting a negotiation would push a group past MAX_GROUP_SIZE"""
+
+class NegotiationNotPendingError(Exception):
+    """Raised when the negotiation was already answered (e.g. a repeated YES)"""
+
+def count_accepted_negotiations(requesting_user: str, transaction=None) -> int:
+    """Server-side count of the requester's recently accepted negotiations (the current group)"""
+    # Acceptances from earlier requests are older than the window and don't count toward this one
+    cutoff = datetime.now() - NEGOTIATION_PENDING_WINDOW
+    accepted_count_result = db.collection('negotiations')\
+                              .where('from_user', '==', requesting_user)\
+                              .where('status', '==', 'accepted')\
+                              .where('created_at', '>=', cutoff)\
+                              .count().get(transaction=transaction)
+    return int(accepted_count_result[0][0].value)
+
+@firestore.transactional
+def accept_negotiation_if_room(transaction, negotiation_ref, counter_ref, requesting_user: str) -> int:
+    """
+    Check the requester's group capacity and mark the negotiation accepted in one transaction.
+    
+    The group counter lives in negotiation_groups/{requesting_user}; it is seeded from the
+    recently accepted negotiations when missing or expired, and deleted by cleanup_all_user_data
+    when the requester starts a new request. Returns the new group size, raises GroupFullError,
+    or NegotiationNotPendingError if the negotiation was already answered.
+    """
+    now = datetime.now(timezone.utc)
+    # Re-read the negotiation inside the transaction: the caller found it with a plain query,
+    # and two quick YES replies would otherwise both pass the capacity check and both count
+    negotiation_snapshot = negotiation_ref.get(transaction=transaction)
+    negotiation_status = (negotiation_snapshot.to_dict() or {}).get('status') if negotiation_snapshot.exists else None
+    if negotiation_status != 'pending':
+        raise NegotiationNotPendingError(f"negotiation {negotiation_ref.id} is {negotiation_status}")
+    
+    counter_snapshot = counter_ref.get(transaction=transaction)
+    counter_data = (counter_snapshot.to_dict() or {}) if counter_snapshot.exists else {}
+    expires_at = counter_data.get('expires_at')
+    if expires_at and expires_at > now:
+        accepted_count = int(counter_data.get('accepted_count', 0))
+    else:
+        # No counter yet, or it belongs to an earlier request - start from this request's acceptances
+        accepted_count = count_accepted_negotiations(requesting_user, transaction=transaction)
+    
+    proposed_group_size = accepted_count + 2  # requester + this user + accepted others
+    if proposed_group_size > MAX_GROUP_SIZE:
+        raise GroupFullError(f"group for {requesting_user} is full ({accepted_count} accepted)")
+    
+    transaction.update(negotiation_ref, {'status': 'accepted'})
+    transaction.set(counter_ref, {
+        'requesting_user': requesting_user,
+        'accepted_count': accepted_count + 1,
+        'updated_at': now,
+        'expires_at': now + NEGOTIATION_PENDING_WINDOW  # Lapses with the request's negotiations
+    }, merge=True)
+    
+    return proposed_group_size
+
 def handle_group_response_yes_node(state: PangeaState) -> PangeaState:
     """Handle YES response to group invitation and start order process"""
     
@@ -2350,7 +2948,6 @@ def handle_group_response_yes_node(state: PangeaState) -> PangeaState:
                 
             except Exception as order_error:
                 print(f"❌ Error starting order process for {user_phone}: {order_error}")
-                import traceback
                 print(f"Full traceback: {traceback.format_exc()}")
                 
                 # Fallback: send manual order instructions
@@ -2394,6 +2991,7 @@ Let me know if you need any help!"""
         pending_negotiations = db.collection('negotiations')\
                                .where('to_user', '==', user_phone)\
                                .where('status', '==', 'pending')\
+                               .select(['from_user', 'negotiation_id', 'proposal'])\
                                .limit(1).get()
         
         if len(pending_negotiations) > 0:
@@ -2420,16 +3018,20 @@ Let me know if you need any help!"""
             
             # 1. collect essentials BEFORE accepting
             requesting_user = negotiation_data['from_user']
-            other_accepted = db.collection('negotiations')\
-                                 .where('from_user', '==', requesting_user)\
-                                 .where('status', '==', 'accepted')\
-                                 .get()
-            proposed_group_size = len(other_accepted) + 2  # requester + this user + accepted others
+            counter_ref = db.collection('negotiation_groups').document(requesting_user)
             
-            print(f"🔍 OLD SYSTEM: requester={requesting_user}, other_accepted={len(other_accepted)}, proposed_size={proposed_group_size}")
-            
-            # 2. FULL-GROUP gate
-            if proposed_group_size > MAX_GROUP_SIZE:
+            # 2. FULL-GROUP gate + accept, atomically (concurrent YES replies can't over-fill the group)
+            try:
+                proposed_group_size = accept_negotiation_if_room(
+                    db.transaction(), negotiation_doc.reference, counter_ref, requesting_user
+                )
+            except NegotiationNotPendingError as answered:
+                # Repeated YES - the first reply already accepted it, so this one is a no-op
+                print(f"⚠️ OLD SYSTEM: {answered}")
+                state['messages'].append(AIMessage(content="Duplicate YES ignored"))
+                return state
+            except GroupFullError as full:
+                print(f"🔍 OLD SYSTEM: {full}")
                 send_friendly_message(
                     user_phone,
                     "Sorry, that group filled up just before you replied. "
@@ -2440,8 +3042,8 @@ Let me know if you need any help!"""
                 state['messages'].append(AIMessage(content="Group response YES rejected (group full)"))
                 return state
             
-            # 3. we still have room – now mark the negotiation accepted
-            negotiation_doc.reference.update({'status': 'accepted'})
+            # 3. we had room – the negotiation is now accepted
+            print(f"🔍 OLD SYSTEM: requester={requesting_user}, proposed_size={proposed_group_size}")
             
             proposal = negotiation_data.get('proposal', {})
             restaurant = (
@@ -2459,20 +3061,23 @@ Let me know if you need any help!"""
             
             try:
                 # FIXED: Import and call start_order_process properly
-                from pangea_order_processor import start_order_process
+                from pangea_order_processor import start_order_process, get_user_order_session
                 
-                order_session = start_order_process(
+                # This user's order setup and the requester's session lookup are independent - overlap them
+                order_future = _EXEC.submit(
+                    start_order_process,
                     user_phone=user_phone,
                     group_id=group_id,
                     restaurant=restaurant,
                     group_size=group_size,
                     delivery_time=delivery_time
                 )
+                requester_session_future = _EXEC.submit(get_user_order_session, requesting_user)
+                order_session = order_future.result()
                 
                 # Also start for requester if not started
                 try:
-                    from pangea_order_processor import get_user_order_session
-                    requesting_user_session = get_user_order_session(requesting_user)
+                    requesting_user_session = requester_session_future.result()
                     
                     if not requesting_user_session:  # Check if session exists properly
                         requester_order_session = start_order_process(
@@ -2491,7 +3096,6 @@ Let me know if you need any help!"""
                 
             except Exception as e:
                 print(f"❌ Error starting order process for negotiation: {e}")
-                import traceback
                 print(f"Full traceback: {traceback.format_exc()}")
                 
                 # Send fallback message
@@ -2512,7 +3116,6 @@ Let me know if you need any help!"""
             
     except Exception as e:
         print(f"Error handling group response YES: {e}")
-        import traceback
         print(f"Full traceback: {traceback.format_exc()}")
         send_friendly_message(
             user_phone,
@@ -2531,7 +3134,7 @@ def handle_alternative_response_node(state: PangeaState) -> PangeaState:
     user_phone = state['user_phone']
     last_message = state['messages'][-1].content.lower().strip()
     
-    if 'yes' in last_message or 'y' == last_message or 'sure' in last_message:
+    if classify_yes_no_reply(last_message) == 'yes':
         # User wants the alternative - start new negotiation
         alternatives = state.get('alternative_suggestions', [])
         
@@ -2577,16 +3180,15 @@ def handle_proactive_group_yes_node(state: PangeaState) -> PangeaState:
     
     try:
         # Update notification response
-        update_proactive_notification_response(user_phone, 'accepted')
+        update_proactive_notification_response(user_phone, 'accepted', proactive_data)
         
         # Get group details from the notification
         group_id = proactive_data.get('group_id', '')
         restaurant = proactive_data.get('restaurant', '')
         delivery_time = proactive_data.get('time', 'now')
         
-        # Calculate new group size (this would be more sophisticated in real implementation)
-        # For now, assume group size is 3 (original + this user)
-        new_group_size = 3
+        # Group size (current members + this user) was recorded when the notification went out
+        new_group_size = min(proactive_data.get('expected_group_size', MAX_GROUP_SIZE), MAX_GROUP_SIZE)
         
         # Start order process directly - skip negotiation since group is already forming
         print(f"🚀 User {user_phone} accepted proactive invitation for {restaurant} at {delivery_time}")
@@ -2650,7 +3252,7 @@ def handle_proactive_group_no_node(state: PangeaState) -> PangeaState:
     
     try:
         # Update notification response
-        update_proactive_notification_response(user_phone, 'declined')
+        update_proactive_notification_response(user_phone, 'declined', proactive_data)
         
         # Send acknowledgment
         acknowledgment_message = "No worries! 👍 I'll keep an eye out for other opportunities that might interest you."
@@ -2710,9 +3312,10 @@ def faq_answered_node(state: PangeaState) -> PangeaState:
 
 def should_continue_negotiating(state: PangeaState) -> str:
     """
-    Enhanced decision-making using Claude 4's reasoning capabilities.
+    Decide the next step of the negotiation loop.
     
-    Considers multiple factors beyond simple counting to make optimal decisions.
+    Uses deterministic rules over the negotiation counts; set
+    USE_LLM_NEGOTIATION_DECISION=true to let Claude make the call instead.
     """
     
     # Check if a perfect match group was already formed - THIS SHOULD BE FIRST
@@ -2751,12 +3354,19 @@ def should_continue_negotiating(state: PangeaState) -> str:
         print(f"⚠️ Error checking order session: {e}")
     
     negotiations = state['active_negotiations']
-    confirmed = [neg for neg in negotiations if neg['status'] == 'accepted']
-    pending = [neg for neg in negotiations if neg['status'] == 'pending']
-    rejected = [neg for neg in negotiations if neg['status'] == 'rejected']
+    # One pass over the negotiations - only the counts matter for the decision
+    confirmed = pending = rejected = 0
+    for neg in negotiations:
+        status = neg['status']
+        if status == 'accepted':
+            confirmed += 1
+        elif status == 'pending':
+            pending += 1
+        elif status == 'rejected':
+            rejected += 1
     search_attempts = state.get('search_attempts', 0)
     
-    print(f"🔍 Negotiations: {len(negotiations)} total, {len(confirmed)} confirmed, {len(pending)} pending, Search attempts: {search_attempts}")
+    print(f"🔍 Negotiations: {len(negotiations)} total, {confirmed} confirmed, {pending} pending, Search attempts: {search_attempts}")
     
     # Check if this user has pending group invitations - if so, wait for response
     try:
@@ -2803,21 +3413,46 @@ def should_continue_negotiating(state: PangeaState) -> str:
                     return "wait_for_responses"
             
             print(f"❌ No pending invitations found, proceeding to solo order")
-            print(f"🔍 DEBUG: Checked {len(pending_groups)} groups with status='pending_responses' for user {user_phone}")
+            logger.debug("Checked %s groups with status='pending_responses' for user %s", len(pending_groups), user_phone)
             
         except Exception as e:
             print(f"⚠️ Could not check for pending invitations: {e}")
         
         return "no_group_found"
     
-    # Try Claude 4 reasoning first, but with a fallback
+    # Optional Claude decision, kept behind a flag for A/B comparison
+    if USE_LLM_NEGOTIATION_DECISION:
+        decision = llm_negotiation_decision(confirmed, pending, rejected)
+        if decision:
+            return decision
+    
+    # Deterministic rules - no model round-trip on the negotiation hot path
+    if confirmed >= MAX_GROUP_SIZE - 1:
+        print("🎯 Group is full: Finalizing group")
+        return "finalize_group"
+    elif confirmed >= 1 and pending == 0:
+        print("🎯 All responses in: Finalizing group")
+        return "finalize_group"
+    elif pending > 0:
+        print("🎯 Wait for responses")
+        return "wait_for_responses"  # This goes to wait node → END
+    elif not confirmed:
+        print("🎯 No candidates yet: Expanding search")
+        return "expand_search"
+    else:
+        print("🎯 No group found")
+        return "no_group_found"
+
+def llm_negotiation_decision(confirmed: int, pending: int, rejected: int) -> Optional[str]:
+    """Ask Claude for the next negotiation step; returns None if the answer is unusable"""
+    
     decision_prompt = f"""
     Analyze this negotiation state and decide next action:
     
-    Confirmed acceptances: {len(confirmed)}
-    Pending negotiations: {len(pending)} 
-    Rejected: {len(rejected)}
-    Max group size: 3 people
+    Confirmed acceptances: {confirmed}
+    Pending negotiations: {pending} 
+    Rejected: {rejected}
+    Max group size: {MAX_GROUP_SIZE} people
     
     Options:
     - finalize_group: We have a good group, proceed with order
@@ -2870,23 +3505,70 @@ def should_continue_negotiating(state: PangeaState) -> str:
                 print(f"✅ Claude decided (extracted): {valid_decision}")
                 return valid_decision
         
-        print(f"⚠️ Claude gave unclear response: '{decision}', using fallback logic")
+        print(f"⚠️ Claude gave unclear response: '{decision}', using deterministic rules")
         
     except Exception as e:
-        print(f"❌ Claude API failed: {e}, using fallback logic")
+        print(f"❌ Claude API failed: {e}, using deterministic rules")
     
-    # FALLBACK: Simple, decisive logic that always ends the workflow
-    if len(confirmed) >= 1:
-        print("🎯 Fallback: Finalizing group")
-        return "finalize_group"
-    elif len(pending) > 0:
-        print("🎯 Fallback: Wait for responses")
-        return "wait_for_responses"  # This goes to wait node → END
-    else:
-        print("🎯 Fallback: No group found")
-        return "no_group_found"
+    return None
 
 # ===== WELCOME FLOW WITH 2025 ENHANCEMENTS =====
+# Static prompt blocks, built once at import so every call sends an identical prefix. Both are
+# plain system messages: ~75-135 tokens is far under the 1024-token prompt-caching minimum
+WELCOME_SYSTEM_PROMPT = f"""Create a warm, friendly welcome message for a new user joining Pangea food delivery.
+
+Requirements:
+- Sound like a helpful friend, not a bot
+- Mention the 5 available restaurants naturally
+- Explain the concept briefly but engagingly
+- Set expectations for how the AI friend will help
+- Include appropriate emojis but don't overdo it
+- Keep it conversational and exciting
+
+Available restaurants:
+{', '.join(RESTAURANTS)}
+
+The tone should be: friendly, helpful, slightly excited about food, trustworthy"""
+
+# Pre-written morning greetings by cohort (see greeting_cohort); {cuisine} is the user's top cuisine
+GREETING_BANK = {
+    'new_any': [
+        "Hey! 👋 Hope you're having a great morning!\n\nWhere are you planning to be on campus today? And what are you thinking about for lunch?\n\nI can help you find some lunch buddies! 🍜",
+        "Good morning! ☀️ Any lunch plans yet?\n\nLet me know where you'll be on campus today and I'll look for people to split delivery with! 🍽️",
+        "Morning! 👋 Where will you be around lunch today?\n\nTell me what you're craving and I'll find you a group to order with 😊",
+    ],
+    'new_cuisine': [
+        "Good morning! ☀️ Feeling like {cuisine} again today?\n\nLet me know where you'll be on campus and I'll look for a lunch group for you! 🍽️",
+        "Hey! 👋 Hope your morning's going well!\n\nAny lunch plans? If {cuisine} sounds good, tell me where you'll be and I'll find some buddies 😊",
+    ],
+    'regular_any': [
+        "Morning! ☀️ Ready to plan lunch?\n\nWhere are you headed on campus today, and what sounds good? I'll line up a group for you 🍜",
+        "Hey, good to see you again! 👋 Where will you be around lunch today?\n\nTell me what you're in the mood for and I'll find people to order with!",
+    ],
+    'regular_cuisine': [
+        "Morning! ☀️ {cuisine} for lunch today, or something new?\n\nLet me know where you'll be and I'll set up a group 🍽️",
+        "Hey! 👋 Hope you're having a good morning!\n\nWhere are you today? I can look for a {cuisine} group - or anything else you're craving 😊",
+    ],
+    'frequent_any': [
+        "Morning, lunch pro! ☀️ Where are you today and what are we ordering?\n\nI'll get a group together for you 🙌",
+        "Hey! 👋 Another day, another lunch group?\n\nTell me where you'll be and what you feel like and I'll take care of the rest 🍜",
+    ],
+    'frequent_cuisine': [
+        "Morning! ☀️ Usual {cuisine} run today?\n\nTell me where you'll be and I'll find your lunch crew 🙌",
+        "Hey! 👋 Want me to put together a {cuisine} group again today, or switch it up?\n\nJust let me know where you'll be on campus 🍽️",
+    ],
+}
+
+# Share of morning check-ins personalized by Claude instead of the greeting bank
+PERSONALIZE_WITH_LLM = float(os.getenv('PERSONALIZE_WITH_LLM', '0.05'))
+
+MORNING_SYSTEM_PROMPT = """Create a personalized morning check-in message for the user described below.
+
+Make it feel natural and personalized, like a friend who knows their food habits.
+Ask about their location and lunch plans for today.
+Reference their past preferences subtly if relevant.
+Keep it brief and friendly."""
+
 def welcome_new_user_node(state: PangeaState) -> PangeaState:
     """
     Enhanced welcome experience using Claude 4's conversational abilities.
@@ -2894,26 +3576,12 @@ def welcome_new_user_node(state: PangeaState) -> PangeaState:
     Creates personalized onboarding and establishes AI Friend relationship.
     """
     
-    # Use Claude 4 to create personalized welcome message
-    welcome_prompt = f"""
-    Create a warm, friendly welcome message for a new user joining Pangea food delivery.
-    
-    Requirements:
-    - Sound like a helpful friend, not a bot
-    - Mention the 5 available restaurants naturally
-    - Explain the concept briefly but engagingly
-    - Set expectations for how the AI friend will help
-    - Include appropriate emojis but don't overdo it
-    - Keep it conversational and exciting
-    
-    Available restaurants:
-    {', '.join(RESTAURANTS)}
-    
-    The tone should be: friendly, helpful, slightly excited about food, trustworthy
-    """
-    
+    # Use Claude 4 to create personalized welcome message (prompt is a cached static block)
     try:
-        welcome_response = anthropic_llm.invoke([HumanMessage(content=welcome_prompt)])
+        welcome_response = anthropic_llm.invoke([
+            SystemMessage(content=WELCOME_SYSTEM_PROMPT),
+            HumanMessage(content="Write the welcome message for this new user now.")
+        ])
         welcome_message = welcome_response.content
     except:
         # Fallback message if Claude call fails
@@ -2950,6 +3618,7 @@ What sounds good? 😊"""
     }
     
     db.collection('users').document(state['user_phone']).set(user_profile)
+    _prefs_cache.pop(state['user_phone'])
     
     # Send welcome message
     send_friendly_message(
@@ -2962,7 +3631,7 @@ What sounds good? 😊"""
     state['conversation_stage'] = 'welcomed'
     
     # Log welcome interaction for learning
-    update_user_memory(state['user_phone'], {
+    run_in_background(update_user_memory, state['user_phone'], {
         'interaction_type': 'welcome',
         'restaurants_shown': RESTAURANTS,
         'onboarding_completed': True
@@ -2970,39 +3639,53 @@ What sounds good? 😊"""
     
     return state
 
+def greeting_cohort(user_prefs: Dict) -> str:
+    """Bucket a user by order history and whether we know a favorite cuisine"""
+    past_orders = len(user_prefs.get('successful_matches', []))
+    if past_orders >= 10:
+        tier = 'frequent'
+    elif past_orders >= 5:
+        tier = 'regular'
+    else:
+        tier = 'new'
+    
+    has_cuisine = bool(user_prefs.get('preferences', {}).get('favorite_cuisines'))
+    return f"{tier}_{'cuisine' if has_cuisine else 'any'}"
+
+def generate_llm_morning_greeting(user_prefs: Dict) -> Optional[str]:
+    """Claude-written morning greeting (static guidance is a cached prompt block)"""
+    personalization_prompt = f"""User history: {json_dumps(user_prefs.get('preferences', {}))}
+Past successful orders: {len(user_prefs.get('successful_matches', []))}"""
+    
+    try:
+        greeting_response = anthropic_llm.invoke([
+            SystemMessage(content=MORNING_SYSTEM_PROMPT),
+            HumanMessage(content=personalization_prompt)
+        ])
+        return greeting_response.content
+    except Exception as e:
+        print(f"❌ Claude morning greeting failed: {e}")
+        return None
+
 # ===== ENHANCED MORNING CHECK-IN WITH LEARNING =====
 def morning_greeting_node(state: PangeaState) -> PangeaState:
     """
-    Personalized morning greeting using Claude 4's contextual understanding.
+    Personalized morning greeting picked from GREETING_BANK by user cohort.
     
-    Adapts message based on user's history and preferences.
+    A PERSONALIZE_WITH_LLM share of users gets a Claude-written greeting instead.
     """
     
     user_prefs = get_user_preferences(state['user_phone'])
     
-    # Create personalized morning message using Claude 4
-    personalization_prompt = f"""
-    Create a personalized morning check-in message for this user:
-    
-    User history: {json.dumps(user_prefs.get('preferences', {}), default=str)}
-    Past successful orders: {len(user_prefs.get('successful_matches', []))}
-    
-    Make it feel natural and personalized, like a friend who knows their food habits.
-    Ask about their location and lunch plans for today.
-    Reference their past preferences subtly if relevant.
-    Keep it brief and friendly.
-    """
-    
-    try:
-        greeting_response = anthropic_llm.invoke([HumanMessage(content=personalization_prompt)])
-        greeting = greeting_response.content
-    except:
-        # Fallback greeting
-        greeting = """Hey! 👋 Hope you're having a great morning! 
-
-Where are you planning to be on campus today? And what are you thinking about for lunch? 
-
-I can help you find some lunch buddies! 🍜"""
+    # Most users get a pre-written greeting for their cohort; a small share still
+    # gets a fresh Claude-written one so the bank can be compared and refreshed
+    greeting = None
+    if random.random() < PERSONALIZE_WITH_LLM:
+        greeting = generate_llm_morning_greeting(user_prefs)
+    if not greeting:
+        cohort = greeting_cohort(user_prefs)
+        top_cuisine = (user_prefs.get('preferences', {}).get('favorite_cuisines') or ['lunch'])[0]
+        greeting = random.choice(GREETING_BANK[cohort]).format(cuisine=top_cuisine)
     
     send_friendly_message(
         state['user_phone'], 
@@ -3016,6 +3699,7 @@ I can help you find some lunch buddies! 🍜"""
     return state
 
 # ===== MAIN LANGGRAPH WITH 2025 ENHANCEMENTS =====
+@lru_cache(maxsize=1)
 def create_pangea_graph():
     """
     Create enhanced LangGraph using 2025 best practices and Claude 4 capabilities.
@@ -3108,29 +3792,109 @@ def create_pangea_graph():
     return workflow.compile()
 
 
+# Static coordinator instructions; only the group's preferred times change per call. Sent as a
+# plain system message - at ~150 tokens it is far under the 1024-token prompt-caching minimum
+TIME_OPTIMIZATION_SYSTEM_PROMPT = """You have a group wanting to order food together. You will be given their preferred times.
+
+What's the best single delivery time that works for everyone? Consider:
+- Most people's preferences
+- Realistic meal times (lunch is usually 11:30am-1:30pm, dinner 5:30pm-8pm)
+- Delivery logistics (pickup orders need about 20-30 minutes to be ready)
+- "now", "asap" and "soon" mean as early as possible; "flexible" fits any time
+- When preferences are ranges, pick a time inside the overlap, as early as practical
+
+Suggest one optimal time (like "12:30pm" or "now" or "in 20 minutes"):"""
+
+_CLOCK_TIME_RE = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?(?!\s*(?:min|hour|hr|\d))")
+_PM_CUE_RE = re.compile(r"\b(?:tonight|evening|night|dinner|afternoon)\b")
+_AM_CUE_RE = re.compile(r"\b(?:morning|breakfast|brunch)\b")
+
+# A bare clock time this far behind the current time still counts as "today" (running late)
+BARE_TIME_GRACE_MINUTES = 30
+
+def parse_time_to_minutes(time_text: str, now: Optional[datetime] = None) -> Optional[int]:
+    """Minute-of-day for the first clock time in text like '12:30pm' or '12:30 - 1 p.m.'
+    
+    A bare 1-11 ("at 7") takes am/pm from words like "tonight" or "morning", else from the
+    current time: the next upcoming of the two readings wins.
+    """
+    time_text = time_text.lower().replace('.', '')
+    matches = _CLOCK_TIME_RE.findall(time_text)
+    if not matches:
+        return None
+    
+    hour, minute_text, meridiem = matches[0]
+    hour, minute = int(hour), int(minute_text or 0)
+    # In a range the am/pm usually only follows the end ("12:30 - 1pm")
+    meridiem = meridiem or matches[-1][2]
+    if hour > 23 or minute > 59 or (hour > 12 and not minute_text and not meridiem):
+        return None
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    elif not meridiem and 1 <= hour <= 11:
+        hour = _infer_meridiem_hour(hour, minute, time_text, now)
+    return hour * 60 + minute
+
+def _infer_meridiem_hour(hour: int, minute: int, time_text: str, now: Optional[datetime]) -> int:
+    """24h hour for a bare 1-11 clock time (see parse_time_to_minutes)"""
+    if _PM_CUE_RE.search(time_text):
+        return hour + 12
+    if _AM_CUE_RE.search(time_text):
+        return hour
+    
+    now = now or datetime.now()
+    earliest = now.hour * 60 + now.minute - BARE_TIME_GRACE_MINUTES
+    if hour * 60 + minute >= earliest:
+        return hour
+    if (hour + 12) * 60 + minute >= earliest:
+        return hour + 12
+    # Both readings already passed today: fall back to meal hours ("at 1" means lunch, not 1am)
+    return hour + 12 if hour <= 6 else hour
+
+def format_minutes(minutes: int) -> str:
+    """Minute-of-day back to '12:30pm' form"""
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour % 12) or 12}:{minute:02d}{'am' if hour < 12 else 'pm'}"
+
+def heuristic_group_time(all_times: List[str], now: Optional[datetime] = None) -> Optional[str]:
+    """Median clock time for the group (requester's time first), or None if under 2 are parseable.
+    
+    "now"/"flexible" and other unparseable times defer to the requester's time; with an
+    even count the earlier middle value wins.
+    """
+    now = now or datetime.now()  # One clock for every bare time in the group
+    requester_minutes = parse_time_to_minutes(all_times[0], now)
+    parsed = []
+    for time_text in all_times:
+        minutes = parse_time_to_minutes(time_text, now)
+        parsed.append(minutes if minutes is not None else requester_minutes)
+    parsed = sorted(minutes for minutes in parsed if minutes is not None)
+    
+    if len(parsed) < 2:
+        return None
+    return format_minutes(parsed[(len(parsed) - 1) // 2])
+
 def find_optimal_group_time(matches: List[Dict], requesting_user_time: str) -> str:
     """Let agent find the best time for the whole group"""
     
     if not matches:
         return requesting_user_time
     
+    all_times = [requesting_user_time] + [match.get('time_requested', 'flexible') for match in matches]
+    
+    # Plain arithmetic covers clock times; Claude only sees what we can't parse
+    optimal_time = heuristic_group_time(all_times)
+    if optimal_time:
+        print(f"🕐 Optimal group time from {all_times}: '{optimal_time}'")
+        return optimal_time
+    
     try:
-        all_times = [requesting_user_time] + [match.get('time_requested', 'flexible') for match in matches]
-        
-        time_optimization_prompt = f"""
-        You have a group wanting to order food together. Here are their preferred times:
-        
-        {', '.join(all_times)}
-        
-        What's the best single delivery time that works for everyone? Consider:
-        - Most people's preferences
-        - Realistic meal times
-        - Delivery logistics
-        
-        Suggest one optimal time (like "12:30pm" or "now" or "in 20 minutes"):
-        """
-        
-        response = anthropic_llm.invoke([HumanMessage(content=time_optimization_prompt)])
+        response = anthropic_llm.invoke([
+            SystemMessage(content=TIME_OPTIMIZATION_SYSTEM_PROMPT),
+            HumanMessage(content=f"Preferred times: {', '.join(all_times)}")
+        ], max_tokens=TIME_MAX_TOKENS)
         optimal_time = response.content.strip()
         
         print(f"🕐 Agent suggests optimal time: '{optimal_time}' for group")
@@ -3141,6 +3905,136 @@ def find_optimal_group_time(matches: List[Dict], requesting_user_time: str) -> s
         return requesting_user_time
 
 
+def start_member_group_order(member_phone: str, group_id: str, restaurant: str, group_size: int, delivery_time: str):
+    """Clear a member's open search and start their order session for a finalized group"""
+    
+    # Clean up active_orders before starting order process
+    try:
+        old_orders = db.collection('active_orders')\
+                      .where('user_phone', '==', member_phone)\
+                      .where('status', '==', 'looking_for_group')\
+                      .get()
+        
+        for old_order in old_orders:
+            old_order.reference.delete()
+            print(f"🗑️ Cleaned up active order for {member_phone}")
+    except Exception as e:
+        print(f"❌ Failed to clean up orders for {member_phone}: {e}")
+    
+    try:
+        from pangea_order_processor import get_payment_link, get_payment_amount, update_order_session
+        
+        session_data = {
+            'user_phone': member_phone,
+            'group_id': group_id,
+            'restaurant': restaurant,
+            'group_size': group_size,
+            'delivery_time': delivery_time,
+            'order_stage': 'need_order_number',
+            'pickup_location': RESTAURANTS.get(restaurant, {}).get('location', 'Campus'),
+            'payment_link': get_payment_link(group_size),
+            'order_session_id': str(uuid.uuid4()),
+            'created_at': datetime.now(),
+            'order_number': None,
+            'customer_name': None
+        }
+        
+        update_order_session(member_phone, session_data)
+        payment_amount = get_payment_amount(group_size)
+        
+        # Send order instructions
+        welcome_message = f"""**Quick steps to get your food:**
+1. Order directly from {restaurant} (app/website/phone) - just make sure to choose PICKUP, not delivery
+2. Come back here with your confirmation number or name for the order AND what you ordered
+
+Once everyone's ready, your payment will be {payment_amount} 💳
+
+Let me know if you need any help!"""
+        
+        send_friendly_message(member_phone, welcome_message, message_type="order_start")
+        print(f"✅ Started order process for {member_phone}")
+    except Exception as e:
+        print(f"❌ Failed to start order process for {member_phone}: {e}")
+
+def generate_group_coordination_message(group_size: int, restaurant: str, location: str, optimal_time: str) -> str:
+    """Use Claude 4 to write the group-formed message, with a template fallback"""
+    
+    coordination_prompt = f"""
+    Create an exciting group coordination message for a successful food order group.
+    
+    Group details:
+    - Total members: {group_size}
+    - Restaurant: {restaurant}
+    - Location: {location or 'campus'}
+    - Optimal delivery time: {optimal_time}
+    
+    The message should:
+    - Celebrate the successful group formation
+    - Mention the optimal delivery time we found for everyone
+    - Mention that individual order instructions are being sent
+    - Sound enthusiastic but organized
+    """
+    
+    try:
+        coord_response = anthropic_llm.invoke([HumanMessage(content=coordination_prompt)])
+        return coord_response.content
+    except:
+        return f"""🎉 Amazing! We've got a group of {group_size} for {restaurant}!
+
+Based on everyone's preferences, the best delivery time is {optimal_time}. 
+
+Everyone is receiving individual order instructions now. Once you all place your orders, I'll coordinate the group payment and pickup!
+
+This is going to be great! 🍜"""
+
+GROUP_PLAN_SYSTEM_PROMPT = TIME_OPTIMIZATION_SYSTEM_PROMPT.rsplit("\n\n", 1)[0] + """
+
+Then write an exciting group coordination message for the group that:
+- Celebrates the successful group formation
+- Mentions the optimal delivery time you picked for everyone
+- Mentions that individual order instructions are being sent
+- Sounds enthusiastic but organized
+
+Respond with ONLY a JSON object, no other text:
+{"optimal_time": "like 12:30pm or now or in 20 minutes", "coordination_message": "the message"}"""
+
+def plan_group_coordination(matches: List[Dict], requesting_user_time: str, group_size: int,
+                            restaurant: str, location: str) -> tuple:
+    """Pick the group's time and write its coordination message in one Claude call.
+    
+    Returns (optimal_time, coordination_message); falls back to the separate
+    time + message calls if the combined response can't be parsed.
+    """
+    all_times = [requesting_user_time] + [match.get('time_requested', 'flexible') for match in matches]
+    
+    # Clock times (or no matches) need no Claude for the time - only the message is written
+    optimal_time = requesting_user_time if not matches else heuristic_group_time(all_times)
+    if optimal_time:
+        print(f"🕐 Optimal group time from {all_times}: '{optimal_time}'")
+        return optimal_time, generate_group_coordination_message(group_size, restaurant, location, optimal_time)
+    
+    try:
+        response = anthropic_llm.invoke([
+            cached_system_message(GROUP_PLAN_SYSTEM_PROMPT),
+            HumanMessage(content=f"""Group details:
+- Total members: {group_size}
+- Restaurant: {restaurant}
+- Location: {location or 'campus'}
+- Preferred times: {', '.join(all_times)}""")
+        ])
+        content = response.content.strip()
+        plan = json_loads(extract_json_text(content))
+        optimal_time = str(plan['optimal_time']).strip()
+        coordination_message = str(plan['coordination_message']).strip()
+        if optimal_time and coordination_message:
+            print(f"🕐 Agent suggests optimal time: '{optimal_time}' for group")
+            return optimal_time, coordination_message
+    except Exception as e:
+        print(f"⚠️ Combined group plan failed, using separate calls: {e}")
+    
+    optimal_time = find_optimal_group_time(matches, requesting_user_time)
+    return optimal_time, generate_group_coordination_message(group_size, restaurant, location, optimal_time)
+
 def finalize_group_node(state: PangeaState) -> PangeaState:
     """Finalize group order with enhanced coordination using Claude 4"""
     
@@ -3158,21 +4052,29 @@ def finalize_group_node(state: PangeaState) -> PangeaState:
         )
         return state
 
-    # Find optimal time for the group
+    location = state['current_request'].get('location')
+    
+    # Find optimal time for the group and write the group message in a single Claude call
     requesting_user_time = state['current_request'].get('time_preference', 'now')
-    optimal_time = find_optimal_group_time(state['potential_matches'], requesting_user_time)
+    optimal_time, success_message = plan_group_coordination(
+        state['potential_matches'], requesting_user_time, group_size, restaurant, location
+    )
     
     # Generate unique group ID
     group_id = str(uuid.uuid4())
     
+    # Everything below is independent I/O per member (Firestore + SMS) plus the
+    # proactive notifications - fan it out instead of running it member by member
+    notify_future = None
     # FIXED: Call notify_compatible_users_of_active_groups directly (not .invoke())
     if len(all_members) < MAX_GROUP_SIZE:  # Group has room for more people
         print(f"🔔 Group has {len(all_members)} members, looking for more compatible users...")
         
-        notify_result = notify_compatible_users_of_active_groups(
+        notify_future = _EXEC.submit(
+            notify_compatible_users_of_active_groups,
             active_group_data={
                 "restaurant": restaurant,
-                "location": state['current_request'].get('location'),
+                "location": location,
                 "time": optimal_time,
                 "current_members": all_members,
                 "group_id": group_id
@@ -3180,111 +4082,46 @@ def finalize_group_node(state: PangeaState) -> PangeaState:
             max_notifications=3,
             compatibility_threshold=0.7
         )
-        
-        print(f"🔔 Proactive notifications sent: {notify_result.get('notifications_sent', 0)}")
     
-    # Clean up active_orders for all group members before starting order process
-    for member_phone in all_members:
-        try:
-            old_orders = db.collection('active_orders')\
-                          .where('user_phone', '==', member_phone)\
-                          .where('status', '==', 'looking_for_group')\
-                          .get()
-            
-            for old_order in old_orders:
-                old_order.reference.delete()
-                print(f"🗑️ Cleaned up active order for {member_phone}")
-        except Exception as e:
-            print(f"❌ Failed to clean up orders for {member_phone}: {e}")
+    # Clean up old active_orders and start the order process for every member (FIXED VERSION)
+    member_futures = [
+        _EXEC.submit(start_member_group_order, member_phone, group_id, restaurant, group_size, optimal_time)
+        for member_phone in all_members
+    ]
+    wait(member_futures)
     
-    # Start order process for all group members (FIXED VERSION)
-    for member_phone in all_members:
+    if notify_future is not None:
         try:
-            from pangea_order_processor import get_payment_link, get_payment_amount, update_order_session
-            
-            session_data = {
-                'user_phone': member_phone,
-                'group_id': group_id,
-                'restaurant': restaurant,
-                'group_size': group_size,
-                'delivery_time': optimal_time,
-                'order_stage': 'need_order_number',
-                'pickup_location': RESTAURANTS.get(restaurant, {}).get('location', 'Campus'),
-                'payment_link': get_payment_link(group_size),
-                'order_session_id': str(uuid.uuid4()),
-                'created_at': datetime.now(),
-                'order_number': None,
-                'customer_name': None
-            }
-            
-            update_order_session(member_phone, session_data)
-            payment_amount = get_payment_amount(group_size)
-            
-            # Send order instructions
-            welcome_message = f"""**Quick steps to get your food:**
-1. Order directly from {restaurant} (app/website/phone) - just make sure to choose PICKUP, not delivery
-2. Come back here with your confirmation number or name for the order AND what you ordered
-
-Once everyone's ready, your payment will be {payment_amount} 💳
-
-Let me know if you need any help!"""
-            
-            send_friendly_message(member_phone, welcome_message, message_type="order_start")
-            print(f"✅ Started order process for {member_phone}")
+            notify_result = notify_future.result()
+            print(f"🔔 Proactive notifications sent: {notify_result.get('notifications_sent', 0)}")
         except Exception as e:
-            print(f"❌ Failed to start order process for {member_phone}: {e}")
-    
-    # Use Claude 4 to create coordinated group message WITH optimal time
-    coordination_prompt = f"""
-    Create an exciting group coordination message for a successful food order group.
-    
-    Group details:
-    - Total members: {group_size}
-    - Restaurant: {restaurant}
-    - Location: {state['current_request'].get('location', 'campus')}
-    - Optimal delivery time: {optimal_time}
-    
-    The message should:
-    - Celebrate the successful group formation
-    - Mention the optimal delivery time we found for everyone
-    - Mention that individual order instructions are being sent
-    - Sound enthusiastic but organized
-    """
-    
-    try:
-        coord_response = anthropic_llm.invoke([HumanMessage(content=coordination_prompt)])
-        success_message = coord_response.content
-    except:
-        success_message = f"""🎉 Amazing! We've got a group of {group_size} for {restaurant}!
-
-Based on everyone's preferences, the best delivery time is {optimal_time}. 
-
-Everyone is receiving individual order instructions now. Once you all place your orders, I'll coordinate the group payment and pickup!
-
-This is going to be great! 🍜"""
+            print(f"❌ Proactive notifications failed: {e}")
     
-    # Send to requesting user
+    # Send to requesting user (after their order instructions)
     send_friendly_message(
         state['user_phone'],
         success_message,
         message_type="match_found"
     )
     
-    # FIXED: Call update_user_memory directly (not .invoke())
-    for member in all_members:
-        update_user_memory(
-            phone_number=member,
-            interaction_data={
-                'interaction_type': 'successful_group_formation',
-                'group_members': all_members,
-                'restaurant': restaurant,
-                'location': state['current_request'].get('location'),
-                'group_size': group_size,
-                'optimal_time': optimal_time,
-                'formation_time': datetime.now(),
-                'group_id': group_id
-            }
-        )
+    # One Firestore batch for every member's learning update
+    interaction_data = {
+        'interaction_type': 'successful_group_formation',
+        'group_members': all_members,
+        'restaurant': restaurant,
+        'location': location,
+        'group_size': group_size,
+        'optimal_time': optimal_time,
+        'formation_time': datetime.now(),
+        'group_id': group_id
+    }
+    # Record everyone's group partners for historical compatibility in the same batch.
+    # Insight extraction is a Claude call per member and nothing below reads the result,
+    # so the whole learning write happens after the node returns
+    run_in_background(batch_update_user_memory, all_members, interaction_data, member_updates={
+        member: {'successful_partners': firestore.ArrayUnion([m for m in all_members if m != member])}
+        for member in all_members
+    })
     
     state['final_group'] = {
         'members': all_members,
@@ -3369,8 +4206,9 @@ Let me know if you need any help!"""
         
         print(f"✅ Started solo order process for {user_phone} - {restaurant} at {delivery_time}")
         
-        # FIXED: Call update_user_memory directly (not .invoke())
-        update_user_memory(
+        # FIXED: Call update_user_memory directly (not .invoke()), off the request thread
+        run_in_background(
+            update_user_memory,
             phone_number=user_phone,
             interaction_data={
                 "interaction_type": "fake_match_solo_order",
@@ -3382,13 +4220,32 @@ Let me know if you need any help!"""
         
     except Exception as e:
         print(f"❌ Failed to start solo order process: {e}")
-        import traceback
         print(f"Full traceback: {traceback.format_exc()}")
 
     state['messages'].append(AIMessage(content=combined_message))
     return state
 
 # ===== TWILIO WEBHOOK HANDLER =====
+# The graph topology never changes at runtime - compile it once and share it across requests
+_COMPILED_APP = None
+_compiled_app_lock = threading.Lock()
+
+def get_app():
+    """Return the compiled Pangea graph, building it on first use (thread-safe)"""
+    global _COMPILED_APP
+    if _COMPILED_APP is None:
+        with _compiled_app_lock:
+            if _COMPILED_APP is None:
+                _COMPILED_APP = create_pangea_graph()
+    return _COMPILED_APP
+
+# Warm the graph cache at import so no request pays for the build. A broken env must not
+# crash the worker on import: get_app() retries the build and the webhook returns 500.
+try:
+    get_app()
+except Exception as e:
+    print(f"❌ Could not build Pangea graph at import: {e}")
+
 def handle_incoming_sms(phone_number: str, message_body: str):
     """Handle incoming SMS and route through LangGraph"""
     
@@ -3408,13 +4265,31 @@ def handle_incoming_sms(phone_number: str, message_body: str):
         proactive_notification_data=None
     )
     
-    # Run through LangGraph
-    app = create_pangea_graph()
-    final_state = app.invoke(initial_state)
+    # Run through LangGraph (compiled once per process)
+    final_state = get_app().invoke(initial_state)
     
     return final_state
 
 # ===== SCHEDULED MORNING CHECK-INS WITH LEARNING =====
+def send_morning_checkin(user_data: Dict):
+    """Send one user's personalized morning greeting"""
+    phone = user_data['phone']
+    
+    # Create personalized morning state
+    morning_state = PangeaState(
+        messages=[],
+        user_phone=phone,
+        user_preferences=user_data.get('preferences', {}),
+        current_request={},
+        potential_matches=[],
+        active_negotiations=[],
+        final_group=None,
+        conversation_stage="morning_checkin"
+    )
+    
+    # Send personalized morning greeting
+    morning_greeting_node(morning_state)
+
 def send_morning_checkins():
     """
     Enhanced morning check-ins using Claude 4's personalization capabilities.
@@ -3422,47 +4297,36 @@ def send_morning_checkins():
     Learns optimal timing and personalization for each user.
     """
     
-    users_ref = db.collection('users')
-    users = users_ref.get()
+    # Stream only the fields we need instead of loading every full user doc up front
+    users = db.collection('users').select(['phone', 'preferences']).stream()
     
-    for user_doc in users:
-        user_data = user_doc.to_dict()
-        phone = user_data['phone']
-        
-        # Skip if user has preferences to not receive morning messages
-        if user_data.get('preferences', {}).get('morning_checkins_disabled'):
-            continue
-        
-        # Create personalized morning state
-        morning_state = PangeaState(
-            messages=[],
-            user_phone=phone,
-            user_preferences=user_data.get('preferences', {}),
-            current_request={},
-            potential_matches=[],
-            active_negotiations=[],
-            final_group=None,
-            conversation_stage="morning_checkin"
-        )
+    # Greetings go out in parallel; cap the in-flight window so memory stays bounded
+    max_in_flight = 64
+    pending = set()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=32, thread_name_prefix="pangea-morning") as executor:
+        for user_doc in users:
+            user_data = user_doc.to_dict() or {}
+            
+            # Skip if user has preferences to not receive morning messages
+            if (user_data.get('preferences') or {}).get('morning_checkins_disabled'):
+                continue
+            
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed += sum(1 for future in done if future.exception())
+            pending.add(executor.submit(send_morning_checkin, user_data))
         
-        # Send personalized morning greeting
-        morning_greeting_node(morning_state)
+        failed += sum(1 for future in wait(pending).done if future.exception())
+    
+    if failed:
+        print(f"❌ {failed} morning check-ins failed")
 
 # ===== HELPER FUNCTIONS =====
 
-def answer_faq_question(user_message: str) -> str:
-    """
-    Uses Claude-4 to answer general questions about Pangea.
-    Internal pricing rules (NOT revealed to users):
-      • Solo order (fake-matched): $2.50 - $3.50
-      • 2-person group:             $4.50 each
-      • 3-person group:             $3.50 each
-    Public-facing language: "delivery is usually $2.50 - $4.50 per person."
-    """
-    prompt = f"""
-You are **Pangea**, a friendly AI lunch-coordination assistant for college students.
-
-The user asked: \"{user_message}\"
+# Static FAQ instructions + restaurant/drop-off lists: byte-identical on every call so the
+# prefix is served from Anthropic's prompt cache; only the user's question varies
+FAQ_SYSTEM_PROMPT = f"""You are **Pangea**, a friendly AI lunch-coordination assistant for college students.
 
 Answer clearly and concisely.  If the user asks:
 • **"How does this work?"** → Give the 5-step flow:
@@ -3494,53 +4358,67 @@ When useful, remind the user:
 ---
 
 **Current restaurant list:**  
-{chr(10).join('- ' + r for r in AVAILABLE_RESTAURANTS)}
+{RESTAURANTS_BULLET_LIST}
 
 **Current drop-off locations:**  
-{chr(10).join('- ' + d for d in AVAILABLE_DROPOFF_LOCATIONS)}
+{DROPOFFS_BULLET_LIST}
 """
-    resp = anthropic_llm.invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
+
+_faq_cache = _TTLCache(ttl=int(os.getenv('FAQ_CACHE_TTL_SECONDS', '86400')), maxsize=512)
+_FAQ_NORMALIZE_RE = re.compile(r"[^a-z0-9\s]")
+
+def faq_cache_key(user_message: str) -> str:
+    """Normalize an FAQ (case, punctuation, whitespace) and hash it into a cache key"""
+    normalized = " ".join(_FAQ_NORMALIZE_RE.sub("", user_message.lower()).split())
+    return "faq:" + hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+def answer_faq_question(user_message: str) -> str:
+    """
+    Uses Claude-4 to answer general questions about Pangea.
+    Internal pricing rules (NOT revealed to users):
+      • Solo order (fake-matched): $2.50 - $3.50
+      • 2-person group:             $4.50 each
+      • 3-person group:             $3.50 each
+    Public-facing language: "delivery is usually $2.50 - $4.50 per person."
+    """
+    # Repeated FAQs ("how does this work?") are answered from cache without calling Claude
+    cache_key = faq_cache_key(user_message)
+    cached = _faq_cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ FAQ cache hit for: {user_message}")
+        return cached
+    
+    resp = anthropic_llm.invoke([
+        cached_system_message(FAQ_SYSTEM_PROMPT),
+        HumanMessage(content=f"The user asked: \"{user_message}\"")
+    ], max_tokens=FAQ_MAX_TOKENS)
+    answer = resp.content.strip()
+    if answer:
+        _faq_cache.set(cache_key, answer)
+    return answer
+
+NEGOTIATION_INVITE_SYSTEM_PROMPT = """Create a specific group order invitation message.
+
+Write a clear, friendly SMS that:
+1. States the specific restaurant, location, and time
+2. Explains this is a group order to split delivery fees
+3. Asks for YES/NO response
+4. Keep it under 160 characters
+
+Do NOT use generic phrases like "great match" or "chatting with AI assistant"
+BE SPECIFIC about the restaurant and details."""
 
 def send_negotiation_notification(target_user: str, negotiation_doc: Dict):
-    """Agent autonomously crafts negotiation message"""
+    """Send a negotiation invitation (template by default, Claude-written when USE_LLM_NEGOTIATION=true)"""
     
     proposal = negotiation_doc['proposal']
     
-    # Agent reasons about the best negotiation approach
     restaurant = proposal.get('restaurant', 'food')
     location = proposal.get('location', 'campus')
     time = proposal.get('time', 'soon')
     
-    negotiation_prompt = f"""
-    Create a specific group order invitation message. Someone wants to order {restaurant} at {location} around {time}.
-    
-    Write a clear, friendly SMS that:
-    1. States the specific restaurant, location, and time
-    2. Explains this is a group order to split delivery fees
-    3. Asks for YES/NO response
-    4. Keep it under 160 characters
-    
-    Do NOT use generic phrases like "great match" or "chatting with AI assistant"
-    BE SPECIFIC about the restaurant and details.
-    
-    Message:"""
-    
-    try:
-        response = anthropic_llm.invoke([HumanMessage(content=negotiation_prompt)])
-        invitation_message = response.content.strip()
-        
-        # Agent validates its own output
-        if len(invitation_message) > 200:
-            invitation_message = invitation_message[:160] + "... Reply YES/NO"
-            
-    except:
-        # Simple fallback
-        restaurant = proposal.get('restaurant', 'food')
-        location = proposal.get('location', 'campus')
-        time = proposal.get('time', 'soon')
-        
-        invitation_message = f"""Hey! 🍕 Someone else wants {restaurant} at {location} around {time} too! 
+    # The template reads just as well for a short invite and costs no Claude round-trip
+    invitation_message = f"""Hey! 🍕 Someone else wants {restaurant} at {location} around {time} too! 
 
 Want to team up for a group order? You'd save on delivery fees and it's more fun! 
 
@@ -3548,13 +4426,25 @@ Reply:
 - YES to join the group
 - NO to pass this time"""
     
-    # Send the message
-    success = send_friendly_message(target_user, invitation_message, message_type="group_invitation")
+    if USE_LLM_NEGOTIATION:
+        try:
+            response = anthropic_llm.invoke([
+                cached_system_message(NEGOTIATION_INVITE_SYSTEM_PROMPT),
+                HumanMessage(content=f"Someone wants to order {restaurant} at {location} around {time}.\n\nMessage:")
+            ], max_tokens=INVITE_MAX_TOKENS)
+            llm_message = response.content.strip()
+            
+            # Agent validates its own output
+            if len(llm_message) > 200:
+                llm_message = llm_message[:160] + "... Reply YES/NO"
+            if llm_message:
+                invitation_message = llm_message
+        except Exception as e:
+            print(f"⚠️ LLM invitation failed, using template: {e}")
     
-    if success:
-        print(f"✅ Agent sent negotiation: {negotiation_doc['negotiation_id']}")
-    else:
-        print(f"❌ Agent negotiation failed: {target_user}")
+    # Send the message
+    send_friendly_message(target_user, invitation_message, message_type="group_invitation")
+    print(f"✅ Agent queued negotiation: {negotiation_doc['negotiation_id']}")
 
 def log_interaction(phone_number: str, interaction_data: Dict):
     """Log interaction for analytics and learning"""
@@ -3570,15 +4460,37 @@ def log_interaction(phone_number: str, interaction_data: Dict):
 # ===== FLASK WEBHOOK SERVER =====
 app = Flask(__name__)
 
-@app.route('/webhook/sms', methods=['POST'])
-def sms_webhook():
-    """Handle incoming SMS from Twilio with proper routing between order processor and main system"""
+# Inbound SMS are acked right away and processed here, so Twilio never waits on Claude
+# (slow webhooks get retried by Twilio, which used to duplicate the whole pipeline)
+_inbound_sms_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('SMS_WORKER_THREADS', '8')),
+    thread_name_prefix="pangea-inbound"
+)
+INBOUND_DEDUPE_WINDOW = timedelta(minutes=5)
+
+def claim_inbound_message(message_sid: str, from_number: str) -> bool:
+    """Record a Twilio MessageSid; False if another delivery of it was already claimed"""
+    try:
+        db.collection('inbound_messages').document(message_sid).create({
+            'from': from_number,
+            'received_at': datetime.now(),
+            'expires_at': datetime.now() + INBOUND_DEDUPE_WINDOW  # Firestore TTL policy field
+        })
+        return True
+    except AlreadyExists:
+        return False
+    except Exception as e:
+        # Never drop a message because the dedupe record couldn't be written
+        print(f"⚠️ Could not record MessageSid {message_sid}: {e}")
+        return True
+
+def process_incoming_sms(from_number: str, message_body: str, message_sid: str = None):
+    """Route one inbound SMS between the order processor and the main system (background worker)"""
+    if message_sid and not claim_inbound_message(message_sid, from_number):
+        print(f"♻️ Duplicate delivery of {message_sid} from {from_number} - already processed")
+        return
+    
     try:
-        from_number = request.form.get('From')
-        message_body = request.form.get('Body')
-        
-        print(f"📱 SMS from {from_number}: {message_body}")
-        
         # Import the classification function from order processor
         from pangea_order_processor import is_new_food_request, get_user_order_session
         
@@ -3595,20 +4507,19 @@ def sms_webhook():
             if order_result is not None:
                 # Message was successfully processed by order system
                 print(f"✅ Order processed: {order_result.get('order_stage', 'unknown')}")
-                return '', 200
+                return
             else:
                 # Order processor couldn't handle it, fall back to main system
                 print(f"🔄 Order processor couldn't handle message, falling back to main system")
         
         # 2. Check if message is a group response (YES/NO)
         message_lower = message_body.lower().strip()
-        group_responses = ['yes', 'y', 'no', 'n', 'sure', 'ok', 'pass', 'nah']
         
-        if message_lower in group_responses:
+        if _YES_RE.fullmatch(message_lower) or _NO_RE.fullmatch(message_lower):
             print(f"🎯 DETECTED GROUP RESPONSE: '{message_body}' - routing directly to main system")
             result = handle_incoming_sms(from_number, message_body)
             print(f"✅ Main system processed group response: {result.get('conversation_stage', 'unknown')}")
-            return '', 200
+            return
         
         # 3. For users without active sessions, check if it's a new food request
         if not existing_session and is_new_food_request(message_body):
@@ -3616,7 +4527,7 @@ def sms_webhook():
             # Route new food requests directly to main system
             result = handle_incoming_sms(from_number, message_body)
             print(f"✅ Main system processed new request: {result.get('conversation_stage', 'unknown')}")
-            return '', 200
+            return
         
         # 4. For users without sessions and non-food messages, try order processor first (might be payment/order details)
         if not existing_session:
@@ -3626,30 +4537,92 @@ def sms_webhook():
             if order_result is not None:
                 # Message was processed by order system (e.g., payment, order details)
                 print(f"✅ Order processed: {order_result.get('order_stage', 'unknown')}")
-                return '', 200
+                return
         
         # 5. Default fallback to main Pangea system
         print(f"🔄 Routing to main Pangea system as final fallback")
         result = handle_incoming_sms(from_number, message_body)
         print(f"✅ Main system processed: {result.get('conversation_stage', 'unknown')}")
         
-        return '', 200
     except Exception as e:
-        print(f"❌ Error in SMS webhook: {e}")
+        print(f"❌ Error processing SMS: {e}")
         # Fallback to main system on error
         try:
             result = handle_incoming_sms(from_number, message_body)
             print(f"✅ Error fallback to main system: {result.get('conversation_stage', 'unknown')}")
-            return '', 200
         except Exception as fallback_error:
             print(f"❌ Fallback also failed: {fallback_error}")
-            return '', 500
+
+
+@app.route('/webhook/sms', methods=['POST'])
+def sms_webhook():
+    """Ack Twilio immediately and process the SMS on a background worker"""
+    from_number = request.form.get('From')
+    message_body = request.form.get('Body')
+    message_sid = request.form.get('MessageSid')
+    
+    print(f"📱 SMS from {from_number}: {message_body}")
+    
+    try:
+        get_app()  # Fail fast with a 500 if the graph can't be built
+        _inbound_sms_pool.submit(process_incoming_sms, from_number, message_body, message_sid)
+        return '', 200
+    except Exception as e:
+        print(f"❌ Could not queue SMS: {e}")
+        return '', 500
+
+@app.route('/tasks/cleanup', methods=['POST'])
+def scheduled_cleanup():
+    """Cloud Scheduler hits this every 5 minutes so cleanup never runs on the SMS path"""
+    # Fail closed: with CRON_SECRET unset the endpoint is disabled rather than open to anyone
+    cron_secret = os.getenv('CRON_SECRET')
+    provided = request.headers.get('X-Cron-Secret', '')
+    if not cron_secret or not hmac.compare_digest(provided.encode(), cron_secret.encode()):
+        return {'status': 'forbidden'}, 403
+    
+    try:
+        return run_scheduled_cleanup(), 200
+    except Exception as e:
+        print(f"❌ Scheduled cleanup failed: {e}")
+        return {'status': 'error'}, 500
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return {'status': 'healthy', 'service': 'Pangea AI Friend'}, 200
 
+def create_app():
+    """gunicorn app factory ('pangea_main:create_app()'): configures logging, returns the Flask app"""
+    configure_logging()
+    return app
+
+def run_production_server(host: str, port: int):
+    """Replace this process with gunicorn serving the pangea_main app on threaded workers"""
+    import sys
+    
+    workers = os.getenv('WEB_CONCURRENCY', '4')
+    threads = os.getenv('GUNICORN_THREADS', '16')
+    print(f"🚀 Starting gunicorn on {host}:{port} ({workers} workers x {threads} threads)")
+    
+    # Workers import pangea_main themselves after forking, so each gets its own
+    # Firestore/Twilio clients and thread pools
+    os.execv(sys.executable, [
+        sys.executable, '-m', 'gunicorn',
+        '--worker-class', 'gthread',
+        '--workers', workers,
+        '--threads', threads,
+        '--bind', f"{host}:{port}",
+        'pangea_main:create_app()'
+    ])
+
 if __name__ == "__main__":
+    configure_logging()
     print("🍜 Starting Pangea AI Friend System...")
     print("Ready to receive SMS messages!")
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    host = os.getenv('HOST', '0.0.0.0')
+    port = int(os.getenv('PORT', '8000'))
+    
+    if os.getenv('FLASK_DEBUG', 'false').lower() == 'true':
+        # Development only: single-process Flask server with auto-reload
+        app.run(host=host, port=port, debug=True)
+    else:
+        run_production_server(host, port)
\ No newline at end of file
@@ -14,6 +14,7 @@ import uuid
 import random
 import threading
 import time
+from functools import lru_cache
 from pangea_locations import RESTAURANTS
 
 # LangGraph imports
@@ -21,12 +22,8 @@ from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.tools import tool
-from langchain_anthropic import ChatAnthropic
 
 # External services
-from twilio.rest import Client
-import firebase_admin
-from firebase_admin import credentials, firestore
 from flask import Flask, request
 
 MAX_GROUP_SIZE = 3 
@@ -38,18 +35,8 @@ try:
     # Use existing Twilio client from main file
     from pangea_main import twilio_client, anthropic_llm, db, send_friendly_message
 except ImportError:
-    # Fallback initialization if running standalone
-    twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
-    anthropic_llm = ChatAnthropic(
-        model="claude-opus-4-20250514",
-        api_key=os.getenv('ANTHROPIC_API_KEY'),
-        temperature=0.1,
-        max_tokens=4096
-    )
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    # Fallback when running standalone: share the lazily-built clients
+    from pangea_services import twilio_client, anthropic_llm, db
 
 # Payment Link Logic
 PAYMENT_LINKS = {
@@ -223,24 +210,16 @@ def collect_order_number_node(state: OrderState) -> OrderState:
         response = anthropic_llm.invoke([HumanMessage(content=extraction_prompt)])
         response_text = response.content.strip()
         
-        # Clean up response - remove any markdown formatting or extra text
-        if '```json' in response_text:
-            # Extract JSON from markdown code block
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            response_text = response_text[start:end]
-        elif '```' in response_text:
+        # Clean up response - remove any markdown formatting or extra text.
+        # The first '{' to the last '}' is the span a greedy r'\{.*\}' search would find
+        start = response_text.find('{')
+        end = response_text.rfind('}')
+        if start != -1 and end > start:
+            response_text = response_text[start:end + 1]
+        else:
             # Remove any code block markers
             response_text = response_text.replace('```', '').strip()
         
-        # Try to find JSON in the response
-        if not response_text.startswith('{'):
-            # Look for JSON in the response
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group()
-        
         print(f"🔍 Trying to parse: '{response_text}'")
         extracted_data = json.loads(response_text)
         
@@ -521,6 +500,7 @@ def route_order_flow(state: OrderState) -> str:
     return state['order_stage']
 
 # Create Order Processing Graph
+@lru_cache(maxsize=1)
 def create_order_graph():
     """Create the order processing workflow graph"""
     
@@ -563,9 +543,7 @@ def create_order_graph():
 def is_new_food_request(message: str) -> bool:
    """Use Claude Opus 4 to intelligently detect if message is food-related vs general question"""
    
-   from langchain_anthropic import ChatAnthropic
    from langchain_core.messages import HumanMessage
-   import os
    
    # CRITICAL FIX: Handle YES/NO responses to group invitations
    message_lower = message.lower().strip()
@@ -576,12 +554,7 @@ def is_new_food_request(message: str) -> bool:
        print(f"🎯 Detected group response: '{message}' - routing to main system")
        return True  # Route to main system to handle group responses
    
-   # Use same Claude Opus 4 model as main system
-   anthropic_llm = ChatAnthropic(
-       model="claude-opus-4-20250514",
-       api_key=os.getenv('ANTHROPIC_API_KEY'),
-   )
-   
+   # Uses the shared module-level Claude Opus 4 client (no per-call client construction)
    classification_prompt = f"""
    Classify this message into one of these categories:
 
@@ -943,7 +916,7 @@ def process_order_message(phone_number: str, message_body: str):
         customer_name=session.get('customer_name')
     )
     
-    app = create_order_graph()
+    app = create_order_graph()  # Compiled once, then served from the lru_cache
     final_state = app.invoke(initial_state)
     
     return final_state
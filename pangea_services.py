@@ -0,0 +1,96 @@
+"""
+Shared external service clients (Twilio, Claude, Firestore)
+
+Each client is built on first use instead of at import, so importing a Pangea
+module (a gunicorn worker before fork, a unit test) doesn't pay for Firebase
+init and client construction it may never need.
+"""
+
+import os
+import threading
+from functools import lru_cache, wraps
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def _build_once(factory):
+    """lru_cache(maxsize=1) plus a lock, so concurrent first calls run the factory only once"""
+    cached = lru_cache(maxsize=1)(factory)
+    lock = threading.Lock()
+    
+    @wraps(factory)
+    def get():
+        if cached.cache_info().currsize:
+            return cached()
+        with lock:
+            # Double-checked: threads that waited on the lock find the client already built
+            return cached()
+    
+    get.cache_info = cached.cache_info
+    get.cache_clear = cached.cache_clear
+    return get
+
+@_build_once
+def get_twilio():
+    """Twilio REST client, created once per process"""
+    from twilio.rest import Client
+    return Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+
+@_build_once
+def get_llm():
+    """Claude chat model, created once per process"""
+    from langchain_anthropic import ChatAnthropic
+    # Use Claude Opus 4 with extended thinking and tool use capabilities
+    # Single client: langchain-anthropic keeps one pooled HTTP client per
+    # (base_url, timeout), so every node and worker thread reuses warm connections.
+    return ChatAnthropic(
+        model="claude-opus-4-20250514",
+        api_key=os.getenv('ANTHROPIC_API_KEY'),
+        temperature=0.1,
+        max_tokens=4096,
+        timeout=60,
+        max_retries=2
+    )
+
+@_build_once
+def get_db():
+    """Firestore client; initializes the Firebase app on first call"""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    # Initialize Firebase (only if not already initialized)
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+class LazyService:
+    """Module-level stand-in for a client that is built on its first real call"""
+
+    def __init__(self, factory, path=()):
+        self._factory = factory
+        self._path = path
+
+    def _resolve(self):
+        target = self._factory()
+        for name in self._path:
+            target = getattr(target, name)
+        return target
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._factory.cache_info().currsize:
+            # Client already exists: hand out the real attribute
+            return getattr(self._resolve(), name)
+        # Not built yet - defer the lookup until something is actually called.
+        # LangGraph walks node globals like `db.collection` when compiling the graph,
+        # which would otherwise force every client into existence at import.
+        return LazyService(self._factory, self._path + (name,))
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+twilio_client = LazyService(get_twilio)
+anthropic_llm = LazyService(get_llm)
+db = LazyService(get_db)
@@ -17,21 +17,13 @@ import uuid
 import re
 import pytz
 
-# Firebase imports
-import firebase_admin
-from firebase_admin import credentials, firestore
-
 # Import from main Pangea system
 try:
     from pangea_main import db, send_friendly_message, anthropic_llm
     from pangea_locations import RESTAURANTS, DROPOFFS
 except ImportError:
     # Fallback initialization if running standalone
-    load_dotenv()
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    from pangea_services import db
 
 load_dotenv()
 
@@ -0,0 +1,160 @@
+# test_deterministic_helpers.py
+# Pure helpers and Firestore payloads that can be checked without live services
+import os
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from google.cloud.firestore_v1 import _helpers
+
+import pangea_main as pm
+
+# ---------------------------------------------------------------------
+def test_proactive_notification_batch_is_encodable():
+    """Both writes in the tracking batch must convert to Firestore values."""
+    fake_db = MagicMock()
+    with patch.object(pm, "db", fake_db):
+        pm.track_proactive_notification("+15550001111", {
+            "restaurant": "Chipotle",
+            "location": "Student Center East",
+            "time": "12:30pm",
+            "group_id": "group-1",
+            "current_members": ["+15550002222"],
+        })
+
+    batch = fake_db.batch.return_value
+    batch.commit.assert_called_once()
+    payloads = [call.args[1] for call in batch.set.call_args_list]
+    assert len(payloads) == 2
+    for payload in payloads:
+        _helpers.encode_dict(payload)  # raises TypeError on e.g. datetime.date
+
+def test_fatigue_counts_todays_string_dates():
+    """Two proactive notifications recorded today (ISO date strings) ⇒ fatigued."""
+    today = pm.datetime.now().date().isoformat()
+    history = [{"type": "proactive_group", "date": today}] * 2
+    assert pm.is_notification_fatigued(history)
+    assert not pm.is_notification_fatigued(history[:1])
+
+# ---------------------------------------------------------------------
+# Regex intent fast path: positive anchored phrasings only, everything else ⇒ Claude (None)
+INTENT_CASES = [
+    ("anyone want thai food rn", "spontaneous_order"),
+    ("hungry, pizza near SCE?", "spontaneous_order"),
+    ("I'll be at Daley Library most of the day", "morning_response"),
+    ("on campus until 3", "morning_response"),
+    ("I'm vegetarian now", "preference_update"),
+    ("stop suggesting burgers", "preference_update"),
+    ("I usually eat lunch around 1", "preference_update"),
+    ("which group is that?", "group_response"),
+    ("hi", "general_question"),
+    ("how does this work", "general_question"),
+    # negations, complaints and bare restaurant names are never fast-routed
+    ("I'm not hungry", None),
+    ("not ordering today thanks", None),
+    ("I can't right now", None),
+    ("I hate chipotle", None),
+    ("chipotle was terrible, never again", None),
+    ("chipotle at the library around 12:30", None),
+    ("I'll be there!", None),
+    ("I prefer not to join", None),
+    ("can't make that one", None),
+]
+
+def test_fast_classify_intent_table():
+    for message, expected in INTENT_CASES:
+        assert pm.fast_classify_intent(message) == expected, message
+
+# ---------------------------------------------------------------------
+def test_scheduled_cleanup_fails_closed():
+    """No CRON_SECRET or a wrong header means 403; only the exact secret runs cleanup."""
+    client = pm.app.test_client()
+    with patch.object(pm, "run_scheduled_cleanup", return_value={"status": "ok"}) as run:
+        with patch.dict(os.environ):
+            os.environ.pop("CRON_SECRET", None)
+            assert client.post("/tasks/cleanup").status_code == 403
+        with patch.dict(os.environ, {"CRON_SECRET": "s3cret"}):
+            assert client.post("/tasks/cleanup", headers={"X-Cron-Secret": "wrong"}).status_code == 403
+            assert client.post("/tasks/cleanup", headers={"X-Cron-Secret": "s3cret"}).status_code == 200
+    run.assert_called_once()
+
+# ---------------------------------------------------------------------
+RESTAURANT_CASES = [
+    ("Chipotle", "chipotle"),
+    ("chipotle bowl", "chipotle"),
+    ("McDonald's", "mcdonald's"),
+    ("burgers", "mcdonald's"),
+    ("cheeseburger", "mcdonald's"),
+    ("hamburgers", "mcdonald's"),
+    ("Chick-fil-A", "chick-fil-a"),
+    ("Chickfil-a", "chick-fil-a"),
+    ("sandwiches", "chick-fil-a"),
+    ("chicken burrito", "chick-fil-a"),
+    ("hot dogs", "portillo's"),
+    ("hot-dog", "portillo's"),
+    ("Italian beef", "portillo's"),
+    ("lattes", "starbucks"),
+    ("pizza", None),
+]
+
+def test_canonical_restaurant_table():
+    for name, expected in RESTAURANT_CASES:
+        assert pm.canonical_restaurant(name) == expected, name
+
+# ---------------------------------------------------------------------
+def test_average_satisfaction_combines_legacy_scores():
+    """Legacy list entries still count once the running total/count exists."""
+    assert pm.average_satisfaction({}) is None
+    assert pm.average_satisfaction({"satisfaction_scores": [8, 10]}) == 9
+    assert pm.average_satisfaction({"satisfaction_total": 12, "satisfaction_count": 2}) == 6
+    assert pm.average_satisfaction({
+        "satisfaction_scores": [10, 10],
+        "satisfaction_total": 4,
+        "satisfaction_count": 2,
+    }) == 6
+
+# ---------------------------------------------------------------------
+MORNING = datetime(2026, 10, 18, 9, 0)
+AFTERNOON = datetime(2026, 10, 18, 15, 0)
+
+TIME_CASES = [
+    # (text, now, minute-of-day)
+    ("12:30pm", MORNING, 12 * 60 + 30),
+    ("12:30 - 1 p.m.", MORNING, 12 * 60 + 30),
+    ("at 11", MORNING, 11 * 60),
+    ("at 1", MORNING, 13 * 60),
+    ("at 7", AFTERNOON, 19 * 60),
+    ("7:30", AFTERNOON, 19 * 60 + 30),
+    ("7 tonight", MORNING, 19 * 60),
+    ("8 this evening", MORNING, 20 * 60),
+    ("2 this afternoon", MORNING, 14 * 60),
+    ("8 tomorrow morning", AFTERNOON, 8 * 60),
+    ("9am", AFTERNOON, 9 * 60),
+    ("flexible", MORNING, None),
+]
+
+def test_parse_time_to_minutes_infers_am_pm():
+    for text, now, expected in TIME_CASES:
+        assert pm.parse_time_to_minutes(text, now) == expected, text
+
+def test_heuristic_group_time_uses_current_time():
+    assert pm.heuristic_group_time(["7", "7:30", "8pm"], now=AFTERNOON) == "7:30pm"
+    assert pm.heuristic_group_time(["11", "11:30"], now=MORNING) == "11:00am"
+    assert pm.heuristic_group_time(["now", "flexible"], now=MORNING) is None
+
+# ---------------------------------------------------------------------
+def test_cached_preferences_are_isolated_from_callers():
+    """Mutating a returned preferences dict must not leak into the 60s cache."""
+    user_doc = MagicMock(exists=True)
+    user_doc.to_dict.return_value = {"preferences": {"favorite_cuisines": ["Thai"]}, "successful_matches": []}
+    fake_db = MagicMock()
+    fake_db.collection.return_value.document.return_value.get.return_value = user_doc
+    phone = "+15550009999"
+    pm._prefs_cache.pop(phone)
+    with patch.object(pm, "db", fake_db):
+        first = pm.load_user_preferences(phone)
+        first["preferences"]["favorite_cuisines"].append("Pizza")
+        first["successful_matches"].append({"restaurant": "Chipotle"})
+        second = pm.load_user_preferences(phone)
+    pm._prefs_cache.pop(phone)
+    assert second["preferences"]["favorite_cuisines"] == ["Thai"]
+    assert second["successful_matches"] == []
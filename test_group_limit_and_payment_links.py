@@ -44,11 +44,17 @@ def _stub_doc(data):
     return doc, ref
 
 def _stub_firestore_chain(return_list):
-    """Chain that satisfies .where().limit().get() → return_list."""
+    """Chain that satisfies .where().select().limit().get() → return_list
+    and .where().count().get() → [[AggregationResult(value=len(return_list))]]."""
     class Chain:
         def __init__(self, payload): self._payload = payload
         def where(self, *a, **k): return self
+        def select(self, *a, **k): return self
         def limit(self, *a, **k): return self
+        def count(self, *a, **k):
+            result = MagicMock()
+            result.value = len(self._payload)
+            return MagicMock(get=MagicMock(return_value=[[result]]))
         def get(self): return self._payload
     return Chain(return_list)
 
@@ -74,6 +80,7 @@ def test_yes_node_group_full_gate():
         "proposal": {"restaurant": "Thai Garden"},
     }
     pending_doc, pending_ref = _stub_doc(pending_data)
+    pending_ref.get.return_value = MagicMock(exists=True, to_dict=MagicMock(return_value=pending_data))
 
     sent_sms = {}
     def fake_send(to, body, **_):
@@ -82,10 +89,18 @@ def test_yes_node_group_full_gate():
     with patch.object(pm, "db") as fake_db, \
          patch.object(pm, "send_friendly_message", side_effect=fake_send):
 
+        # group counter doc has not been created yet → seeded from the count
+        counter_collection = MagicMock()
+        counter_collection.document.return_value.get.return_value = MagicMock(exists=False)
+
         fake_db.collection.side_effect = [
+            _stub_firestore_chain([]),               # perfect-match groups query
             _stub_firestore_chain([pending_doc]),    # pending query
-            _stub_firestore_chain(accepted_docs),    # accepted query
+            _stub_firestore_chain([]),               # group conflict check
+            counter_collection,                      # negotiation_groups counter
+            _stub_firestore_chain(accepted_docs),    # accepted count query (in transaction)
         ]
+        fake_db.transaction.return_value = MagicMock(_max_attempts=1, _read_only=False)
 
         state = {"user_phone": fourth_user, "messages": []}
         out_state = pm.handle_group_response_yes_node(state)
@@ -125,3 +140,47 @@ def test_finalize_group_guard_blocks_oversize():
     fake_sms.assert_called_once()
     # state returned unchanged and without a final group entry
     assert out is state and "final_group" not in out
+
+# ---------------------------------------------------------------------
+def test_expired_group_counter_is_reseeded():
+    """
+    A counter left over from the requester's previous request (expired) must
+    not keep the new group full - capacity is recounted from recent accepts.
+    """
+    counter_ref = MagicMock()
+    counter_ref.get.return_value = MagicMock(
+        exists=True,
+        to_dict=MagicMock(return_value={
+            "accepted_count": 2,
+            "expires_at": pm.datetime.now(pm.timezone.utc) - pm.timedelta(minutes=1),
+        }),
+    )
+    negotiation_ref = MagicMock()
+    negotiation_ref.get.return_value = MagicMock(exists=True, to_dict=MagicMock(return_value={"status": "pending"}))
+
+    with patch.object(pm, "db") as fake_db:
+        fake_db.collection.return_value = _stub_firestore_chain([])  # no recent accepts
+        transaction = MagicMock(_max_attempts=1, _read_only=False)
+        size = pm.accept_negotiation_if_room(transaction, negotiation_ref, counter_ref, "+15550300")
+
+    assert size == 2
+    transaction.update.assert_called_once_with(negotiation_ref, {"status": "accepted"})
+    assert transaction.set.call_args.args[1]["accepted_count"] == 1
+
+# ---------------------------------------------------------------------
+def test_repeated_yes_does_not_count_twice():
+    """
+    A second YES for an already-accepted negotiation is a no-op: nothing is
+    written, so the group counter isn't bumped again.
+    """
+    counter_ref = MagicMock()
+    negotiation_ref = MagicMock()
+    negotiation_ref.get.return_value = MagicMock(exists=True, to_dict=MagicMock(return_value={"status": "accepted"}))
+
+    import pytest
+    transaction = MagicMock(_max_attempts=1, _read_only=False)
+    with pytest.raises(pm.NegotiationNotPendingError):
+        pm.accept_negotiation_if_room(transaction, negotiation_ref, counter_ref, "+15550400")
+
+    transaction.update.assert_not_called()
+    transaction.set.assert_not_called()
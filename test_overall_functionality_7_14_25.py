@@ -45,9 +45,16 @@ from pangea_locations import AVAILABLE_RESTAURANTS, AVAILABLE_DROPOFF_LOCATIONS
 class DummyLLM:
     def __init__(self):
         self.last_prompt = None
-    def invoke(self, msgs):
-        # msgs is a list containing one HumanMessage
-        self.last_prompt = msgs[0].content
+    def invoke(self, msgs, **kwargs):
+        # msgs may hold a cached SystemMessage (content blocks) + a HumanMessage;
+        # flatten everything into one string so the prompt can be inspected
+        parts = []
+        for msg in msgs:
+            if isinstance(msg.content, list):
+                parts.extend(block.get("text", "") for block in msg.content)
+            else:
+                parts.append(msg.content)
+        self.last_prompt = "\n".join(parts)
         return SimpleNamespace(content="OK")
 
 pm.anthropic_llm = DummyLLM()